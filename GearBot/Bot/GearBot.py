@@ -32,12 +32,21 @@ class GearBot(AutoShardedBot):
     def dispatch(self, event_name, *args, **kwargs):
         super().dispatch(event_name, *args, **kwargs)
 
+    def add_cog(self, cog):
+        super().add_cog(cog)
+        TheRealGearBot.cogs_changed()
+
+    def remove_cog(self, name):
+        super().remove_cog(name)
+        TheRealGearBot.cogs_changed()
+
     async def _run_event(self, coro, event_name, *args, **kwargs):
         """
         intercept events, block them from running while locked and track
         """
         while (self.locked or not self.STARTUP_COMPLETE) and event_name != "on_ready":
             await asyncio.sleep(0.2)
+        await TheRealGearBot.ensure_config(event_name, args)
         await super()._run_event(coro, event_name, *args, **kwargs)
 
     #### event handlers, basically bouncing everything to TheRealGearBot file so we can hotreload our listeners
@@ -62,3 +71,12 @@ class GearBot(AutoShardedBot):
 
     async def on_guild_update(self, before, after):
         await TheRealGearBot.on_guild_update(before, after)
+
+    async def on_member_update(self, before, after):
+        await TheRealGearBot.on_member_update(before, after)
+
+    async def on_guild_role_update(self, before, after):
+        await TheRealGearBot.on_guild_role_update(before, after)
+
+    async def on_guild_role_delete(self, role):
+        await TheRealGearBot.on_guild_role_delete(role)
@@ -18,9 +18,10 @@ from discord.ext.commands import UnexpectedQuoteError, ExtensionAlreadyLoaded, I
 
 from Util import Configuration, GearbotLogging, Emoji, Pages, Utils, Translator, InfractionUtils, MessageUtils, \
     ServerInfo
+from Util import Permissioncheckers, HelpGenerator
 from Util.Permissioncheckers import NotCachedException
 from Util.Utils import to_pretty_time
-from database import DatabaseConnector
+from database import DatabaseConnector, DBUtils
 
 
 def prefix_callable(bot, message):
@@ -39,6 +40,7 @@ async def initialize(bot, startup=False):
         #database
         GearbotLogging.info("Connecting to the database.")
         await DatabaseConnector.init()
+        DBUtils.initialize(bot)
         GearbotLogging.info("Database connection established.")
 
         await Emoji.initialize(bot)
@@ -205,7 +207,7 @@ async def on_guild_join(bot, guild: Guild):
         await GearbotLogging.bot_log(f"Someone tried to add me to {await Utils.clean(guild.name)} ({guild.id}) but the owner {guild.owner_id} is blocked")
     else:
         GearbotLogging.info(f"A new guild came up: {guild.name} ({guild.id}).")
-        Configuration.load_config(guild.id)
+        await Configuration.load_async(guild.id)
         name = await Utils.clean(guild.name)
         await guild.chunk(cache=True)
         await GearbotLogging.bot_log(f"{Emoji.get_chat_emoji('JOIN')} A new guild came up: {name} ({guild.id}).", embed=ServerInfo.server_info_embed(guild))
@@ -223,6 +225,39 @@ async def on_guild_update(before, after):
         await after.leave()
         await GearbotLogging.bot_log(f"Someone transferred {await Utils.clean(after.name)} ({after.id}) to {after.owner_id} but they are blocked")
 
+
+def cogs_changed():
+    Permissioncheckers.cogs_changed()
+    HelpGenerator.cogs_changed()
+
+
+async def ensure_config(event_name, args):
+    # handlers shouldn't run on a stand in config, wait for the real one if it's not there yet
+    # joining and leaving handle it themselves, don't make configs for guilds we're about to leave
+    if len(args) == 0 or event_name in ("on_guild_join", "on_guild_remove"):
+        return
+    target = args[0]
+    if isinstance(target, Guild):
+        guild_id = target.id
+    else:
+        guild = getattr(target, "guild", None)
+        guild_id = guild.id if guild is not None else getattr(target, "guild_id", None)
+    if guild_id is not None and not Configuration.is_loaded(guild_id):
+        await Configuration.load_async(guild_id)
+
+
+async def on_member_update(before, after):
+    Permissioncheckers.member_updated(before, after)
+
+
+async def on_guild_role_update(before, after):
+    if before.permissions != after.permissions:
+        Permissioncheckers.roles_changed(after.guild.id)
+
+
+async def on_guild_role_delete(role):
+    Permissioncheckers.roles_changed(role.guild.id)
+
 class PostParseError(commands.BadArgument):
 
     def __init__(self, type, error):
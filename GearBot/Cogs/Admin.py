@@ -1,9 +1,12 @@
+import time
+
 import discord
 from discord.ext import commands
 
 from Cogs.BaseCog import BaseCog
-from Util import GearbotLogging, Utils, Configuration, Pages, MessageUtils
+from Util import GearbotLogging, Utils, Configuration, Pages, MessageUtils, SpamRules, InviteCache, MessageCache
 from Util.Converters import UserID, Guild, DiscordUser
+from database import DBUtils
 
 
 class Admin(BaseCog):
@@ -26,6 +29,13 @@ class Admin(BaseCog):
             await Configuration.initialize(self.bot)
         await ctx.send("Configs reloaded")
 
+    @commands.command()
+    async def copy_configs_to_sql(self, ctx):
+        async with ctx.typing():
+            start = time.perf_counter()
+            copied = await Configuration.migrate_files_to_sql()
+        await ctx.send(f"Copied {copied} guild configs to the database in {time.perf_counter() - start:.2f}s, set CONFIG_STORAGE to sql in the master config and restart to switch over")
+
     @commands.command()
     async def mutuals(self, ctx, user:UserID):
         mutuals = []
@@ -35,6 +45,27 @@ class Admin(BaseCog):
         for page in Pages.paginate("\n".join(f"{guild.id} - {Utils.clean_name(guild.name)}" for guild in mutuals), prefix="```py\n", suffix="```"):
             await ctx.send(page)
 
+    @commands.command()
+    async def spam_plan(self, ctx, guild: Guild):
+        for page in Pages.paginate(SpamRules.describe(SpamRules.get_plan(guild.id)), prefix="```\n", suffix="```"):
+            await ctx.send(page)
+
+    @commands.command()
+    async def invite_cache(self, ctx):
+        await ctx.send(f"```\n{InviteCache.describe()}```")
+
+    @commands.command()
+    async def message_writer(self, ctx):
+        await ctx.send(f"```\n{DBUtils.describe()}```")
+
+    @commands.command()
+    async def message_cache(self, ctx):
+        await ctx.send(f"```\n{MessageCache.describe()}```")
+
+    @commands.command()
+    async def log_queues(self, ctx):
+        await ctx.send(f"```\n{GearbotLogging.describe_log_queues()}```")
+
     @commands.command()
     async def block_server(self, ctx, guild: Guild):
         blocked = Configuration.get_persistent_var("server_blocklist", [])
@@ -1,12 +1,7 @@
 import asyncio
 import datetime
-import re
-
-import emoji
 from asyncio import CancelledError
 
-import emoji
-
 import time
 from collections import deque
 from weakref import WeakValueDictionary
@@ -22,9 +17,8 @@ from discord.utils import snowflake_time
 from Bot import TheRealGearBot
 from Cogs.BaseCog import BaseCog
 from Util import Configuration, InfractionUtils, GearbotLogging, Utils, Translator, MessageUtils, \
-    Permissioncheckers
-from Util.Matchers import MENTION_MATCHER, URL_MATCHER
-from Util.SpamBucket import SpamBucket
+    Permissioncheckers, SpamRules, MessageFeatures
+from Util.SpamBucket import SpamBucket, get_store
 from database.DatabaseConnector import Infraction
 
 class Violation:
@@ -46,21 +40,11 @@ class ActionHolder:
     def __init__(self, count: int):
         self.count = count
 
-EMOJI_REGEX = re.compile('([^<]*)<a?:(?:[^:]+):([0-9]+)>')
-emoji_list = sorted(emoji.UNICODE_EMOJI.keys(), reverse=True)
+
 class AntiSpam(BaseCog):
 
     def __init__(self, bot):
         super().__init__(bot)
-        # store values as functions so only what is needed is computed
-        self.generators = {
-            "max_messages": lambda m: 1,
-            "max_newlines": lambda m: len(m.content.split("\n")) - 1,
-            "max_mentions": lambda m: len(MENTION_MATCHER.findall(m.content)),
-            "max_links": lambda m: len(URL_MATCHER.findall(m.content)),
-            "max_emoji": lambda m: len([1 for c in m.content if c in emoji_list]) + len(EMOJI_REGEX.findall(m.content))
-        }
-
         self.punishments = {
             "warn": self.warn_punishment,
             "mute": self.mute_punishment,
@@ -93,83 +77,57 @@ class AntiSpam(BaseCog):
 
         return self.extra_actions[key]
 
-    def get_bucket(self, guild_id, rule_name, bucket_info, member_id):
-        key = f"{guild_id}-{member_id}-{bucket_info['TYPE']}"
-        c = bucket_info.get("SIZE").get("COUNT")
-        p = bucket_info.get("SIZE").get("PERIOD")
-        return SpamBucket(self.bot.redis_pool, "{}:{}:{}".format(guild_id, rule_name, "{}"), c, p,
-                          self.get_extra_actions(key))
+    def get_bucket(self, rule, member_id):
+        return SpamBucket(get_store(self.bot), rule.key_format, rule.count, rule.period,
+                          self.get_extra_actions(rule.actions_format.format(member_id)))
 
     @commands.Cog.listener()
     async def on_message(self, message: Message):
         if message.author.id == self.bot.user.id or message.guild is None:
             return  # Don't track anti-spam for ourselves or DMs
-        cfg = Configuration.get_var(message.guild.id, "ANTI_SPAM")
-        if not cfg.get("ENABLED", False) or message.id in self.processed:
+        plan = SpamRules.get_plan(message.guild.id)
+        if not plan.checks_messages or message.id in self.processed:
             return
         self.processed.append(message.id)
-        await self.process_message(message)
+        await self.process_message(message, plan)
 
-    async def process_message(self, message: Message):
+    async def process_message(self, message: Message, plan=None):
         # print(f'{datetime.datetime.now().isoformat()} - Processing message')
-        if message.webhook_id is not None or self.is_exempt(message.guild.id, message.author):
+        if plan is None:
+            plan = SpamRules.get_plan(message.guild.id)
+        if message.webhook_id is not None or self.is_exempt(message.guild.id, message.author, plan):
             return
 
         # Use the discord's message timestamp to hopefully not trigger false positives
         msg_time = int(message.created_at.timestamp())
 
-        async def check_bucket(check, friendly_text, amount, b):
-            # print(f"{check} - {amount}")
+        # so if someone does 20 levels of too many mentions for some stupid reason we don't end up running the same regex 20 times for nothing
+        features = MessageFeatures.get_features(message.id, message.content)
+        values = {t: generator(features) for t, generator in plan.metrics}
+        for rule in plan.message_rules:
+            amount = values[rule.type]
             if amount == 0:
-                return
-
-            bucket = self.get_bucket(message.guild.id, check, b, message.author.id)
-            if bucket is not None and await bucket.check(message.author.id, msg_time, amount,
-                                                         f"{message.channel.id}-{message.id}"):
-                count = await bucket.count(message.author.id, msg_time, expire=False)
-                period = await bucket.size(message.author.id, msg_time, expire=False)
+                continue
+            bucket = self.get_bucket(rule, message.author.id)
+            result = await bucket.check(message.author.id, msg_time, amount, f"{message.channel.id}-{message.id}")
+            if result.triggered:
                 self.bot.loop.create_task(
-                    self.violate(Violation(check, message.guild, f"{friendly_text} ({count}/{period}s)", message.author,
-                                           message.channel, await bucket.get(message.author.id, msg_time, expire=False),
-                                           b, count)))
+                    self.violate(Violation(rule.check, message.guild, f"{rule.friendly} ({result.count}/{result.span}s)", message.author,
+                                           message.channel, result.members, rule.bucket, result.count)))
 
-        counters = dict()
-        buckets = Configuration.get_var(message.guild.id, "ANTI_SPAM", "BUCKETS", [])
+        for rule in plan.duplicates:
+            await self.check_duplicates(message, rule)
 
-        # so if someone does 20 levels of too many mentions for some stupid reason we don't end up running the same regex 20 times for nothing
-        cache = dict()
-        for bucket in buckets:
-            t = bucket["TYPE"]
-            counter = counters.get(t, 0)
-            if t == "duplicates":
-                await self.check_duplicates(message, counter, bucket)
-            else:
-                v = 0
-                if t in cache:
-                    v = cache[t]
-                elif t in self.generators:
-                    v = self.generators[t](message)
-                    cache[t] = v
-                if v != 0:
-                    await check_bucket(f"{t}:{counter}", Translator.translate(f"spam_{t}", message), v, bucket)
-
-    async def check_duplicates(self, message: Message, count: int, bucket):
-        rule = bucket["SIZE"]
-        key = f"{message.guild.id}-{message.author.id}-{bucket['TYPE']}"
+    async def check_duplicates(self, message: Message, rule):
         full_content = message.content + "\n".join(str(a) for a in message.attachments)
-        spam_bucket = SpamBucket(self.bot.redis_pool,
-                                 f"spam:duplicates{count}:{message.guild.id}:{message.author.id}:{'{}'}", rule["COUNT"],
-                                 rule["PERIOD"], self.get_extra_actions(key))
+        spam_bucket = self.get_bucket(rule, message.author.id)
         t = int(message.created_at.timestamp())
-        if await spam_bucket.check(full_content, t, 1, f"{message.channel.id}-{message.id}"):
-            count = await spam_bucket.count(full_content, t, expire=False)
-            period = await spam_bucket.size(message.author.id, t, expire=False)
-            st = Translator.translate('spam_max_duplicates', message)
-            self.bot.loop.create_task(self.violate(Violation("max_duplicates", message.guild,
-                                                             f"{st} ({count}/{period}s)",
+        result = await spam_bucket.check(f"{message.author.id}:{full_content}", t, 1, f"{message.channel.id}-{message.id}")
+        if result.triggered:
+            self.bot.loop.create_task(self.violate(Violation(rule.check, message.guild,
+                                                             f"{rule.friendly} ({result.count}/{result.span}s)",
                                                              message.author, message.channel,
-                                                             await spam_bucket.get(full_content, t, expire=False),
-                                                             bucket, count)))
+                                                             result.members, rule.bucket, result.count)))
 
     async def violate(self, v: Violation):
         # deterining current punishment
@@ -268,7 +226,7 @@ class AntiSpam(BaseCog):
         reason = self.assemble_reason(v)
         i = await InfractionUtils.add_infraction(v.guild.id, v.member.id, self.bot.user.id, 'Kick', reason,
                                            active=False)
-        await self.bot.redis_pool.psetex(f"forced_exits:{v.guild.id}-{v.member.id}", 8000, "1")
+        await self.mark_forced_exit(v)
         try:
             if Configuration.get_var(v.guild.id, "INFRACTIONS", "DM_ON_KICK"):
                 asyncio.create_task(Utils.send_infraction(self.bot, v.member, v.guild, 'BOOT', 'kick', "Spam"))
@@ -286,7 +244,7 @@ class AntiSpam(BaseCog):
         reason = self.assemble_reason(v)
         duration = v.bucket["PUNISHMENT"]["DURATION"]
         until = time.time() + duration
-        await self.bot.redis_pool.psetex(f"forced_exits:{v.guild.id}-{v.member.id}", 8000, 1)
+        await self.mark_forced_exit(v)
         await v.guild.ban(v.member, reason=reason, delete_message_days=0)
         i = await InfractionUtils.add_infraction(v.guild.id, v.member.id, self.bot.user.id, 'Tempban', reason,
                                            end=until)
@@ -300,7 +258,7 @@ class AntiSpam(BaseCog):
 
     async def ban_punishment(self, v: Violation):
         reason = self.assemble_reason(v)
-        await self.bot.redis_pool.psetex(f"forced_exits:{v.guild.id}-{v.member.id}", 8000, 1)
+        await self.mark_forced_exit(v)
         await v.guild.ban(v.member, reason=reason, delete_message_days=0)
         await Infraction.filter(user_id=v.member.id, type="Unban", guild_id=v.guild.id).update(active=False)
         i = await InfractionUtils.add_infraction(v.guild.id, v.member.id, self.bot.user.id, 'Ban', reason)
@@ -323,25 +281,20 @@ class AntiSpam(BaseCog):
                     return
 
                 # make sure anti-spam is enabled
-                cfg = Configuration.get_var(message.guild.id, "ANTI_SPAM")
-                if not cfg.get("ENABLED", False) or message.id in self.censor_processed:
+                plan = SpamRules.get_plan(message.guild.id)
+                if not plan.enabled or message.id in self.censor_processed:
                     continue
-                buckets = Configuration.get_var(message.guild.id, "ANTI_SPAM", "BUCKETS", [])
-                count = 0
-                for b in buckets:
-                    t = b["TYPE"]
-                    if t == "censored":
-                        msg_time = int(snowflake_time(message.id).timestamp())
-                        bucket = self.get_bucket(message.guild.id, f"censored:{count}", b, message.author.id)
-                        if bucket is not None and await bucket.check(message.author.id, msg_time, 1, f"{message.channel.id}-{message.id}"):
-                            count = await bucket.count(message.author.id, msg_time, expire=False)
-                            period = await bucket.size(message.author.id, msg_time, expire=False)
-                            self.bot.loop.create_task(
-                                self.violate(Violation("max_censored", message.guild, f"{Translator.translate('spam_max_censored', message)} ({count}/{period}s)",
-                                                       message.author,
-                                                       message.channel,
-                                                       await bucket.get(message.author.id, msg_time, expire=False),
-                                                       b, count)))
+                for rule in plan.censored:
+                    msg_time = int(snowflake_time(message.id).timestamp())
+                    bucket = self.get_bucket(rule, message.author.id)
+                    result = await bucket.check(message.author.id, msg_time, 1, f"{message.channel.id}-{message.id}")
+                    if result.triggered:
+                        self.bot.loop.create_task(
+                            self.violate(Violation(rule.check, message.guild, f"{rule.friendly} ({result.count}/{result.span}s)",
+                                                   message.author,
+                                                   message.channel,
+                                                   result.members,
+                                                   rule.bucket, result.count)))
 
             except CancelledError:
                 pass
@@ -360,25 +313,22 @@ class AntiSpam(BaseCog):
                     return
 
                 # make sure anti-spam is enabled
-                cfg = Configuration.get_var(member.guild.id, "ANTI_SPAM")
-                if after.channel is None or before.channel == after.channel or member is None or not cfg.get("ENABLED", False) or self.is_exempt(member.guild.id, member):
+                if after.channel is None or before.channel == after.channel or member is None:
                     continue
-                buckets = Configuration.get_var(member.guild.id, "ANTI_SPAM", "BUCKETS", [])
-                count = 0
-                for b in buckets:
-                    t = b["TYPE"]
-                    if t == "voice_joins":
-                        now = int(datetime.datetime.utcnow().timestamp())
-                        bucket = self.get_bucket(member.guild.id, f"voice_channel_join", b, member.id)
-                        if bucket is not None and await bucket.check(member.id, now, message=now, amount=1):
-                            count = await bucket.count(member.id, now, expire=False)
-                            period = await bucket.size(member.id, now, expire=False)
-                            self.bot.loop.create_task(
-                                self.violate(Violation("max_voice_joins", member.guild, f"{Translator.translate('spam_max_voice_join', member.guild)} ({count}/{period}s)",
-                                                       member,
-                                                       None,
-                                                       set(),
-                                                       b, count)))
+                plan = SpamRules.get_plan(member.guild.id)
+                if not plan.enabled or len(plan.voice_joins) == 0 or self.is_exempt(member.guild.id, member, plan):
+                    continue
+                for rule in plan.voice_joins:
+                    now = int(datetime.datetime.utcnow().timestamp())
+                    bucket = self.get_bucket(rule, member.id)
+                    result = await bucket.check(member.id, now, message=now, amount=1)
+                    if result.triggered:
+                        self.bot.loop.create_task(
+                            self.violate(Violation(rule.check, member.guild, f"{rule.friendly} ({result.count}/{result.span}s)",
+                                                   member,
+                                                   None,
+                                                   set(),
+                                                   rule.bucket, result.count)))
 
             except CancelledError:
                 pass
@@ -386,20 +336,25 @@ class AntiSpam(BaseCog):
                 await TheRealGearBot.handle_exception("voice spam join detector", self.bot, e)
 
 
+    async def mark_forced_exit(self, v):
+        # without redis there is nobody to tell, anti-spam itself keeps working
+        if self.bot.redis_pool is not None:
+            await self.bot.redis_pool.psetex(f"forced_exits:{v.guild.id}-{v.member.id}", 8000, "1")
+
     @staticmethod
     def assemble_reason(v):
         return Translator.translate('spam_infraction_reason', v.guild, channel=f"#{v.channel}",
                                     friendly=v.friendly)
 
     @staticmethod
-    def is_exempt(guild_id, member: Member):
+    def is_exempt(guild_id, member: Member, plan=None):
         if not hasattr(member, "roles"):
             return False
-        config = Configuration.get_var(guild_id, "ANTI_SPAM")
-        for role in member.roles:
-            if role.id in config["EXEMPT_ROLES"]:
-                return True
-        return member.id in config["EXEMPT_USERS"] or Permissioncheckers.is_mod(member)
+        if plan is None:
+            plan = SpamRules.get_plan(guild_id)
+        if member.id in plan.exempt_users or not plan.exempt_roles.isdisjoint(role.id for role in member.roles):
+            return True
+        return Permissioncheckers.is_mod(member)
 
     @staticmethod
     def _get_mute_role(guild):
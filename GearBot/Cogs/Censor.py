@@ -1,27 +1,23 @@
-import re
 from collections import namedtuple
-import fnmatch
 from urllib import parse
 from urllib.parse import urlparse
 
 import discord
-import emoji
 from discord import DMChannel
 from discord.ext import commands
 
 from Cogs.BaseCog import BaseCog
-from Util import Configuration, GearbotLogging, Permissioncheckers, Utils, MessageUtils, Translator
-from Util.Matchers import INVITE_MATCHER, URL_MATCHER
+from Util import Configuration, GearbotLogging, Permissioncheckers, Utils, MessageUtils, Translator, MessageFeatures, \
+    MatcherRegistry, InviteCache, ConfigViews
+from Util.Matchers import INVITE_MATCHER
 from Util.Utils import assemble_jumplink
 from database.DatabaseConnector import LoggedAttachment
 
-EMOJI_REGEX = re.compile('<a?:(?:[^:]+):([0-9]+)>')
 messageholder = namedtuple('censored_message', 'id author channel guild')
 class Censor(BaseCog):
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.regexes = dict()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -68,68 +64,61 @@ class Censor(BaseCog):
             return
         censorlist = Configuration.get_var(member.guild.id, "CENSORING", "TOKEN_CENSORLIST")
         word_censorlist = Configuration.get_var(member.guild.id, "CENSORING", "WORD_CENSORLIST")
-        guilds = Configuration.get_var(member.guild.id, "CENSORING", "ALLOWED_INVITE_LIST")
+        guilds = ConfigViews.get(member.guild.id).allowed_invites
         domain_list = Configuration.get_var(member.guild.id, "CENSORING", "DOMAIN_LIST")
         domains_allowed = Configuration.get_var(member.guild.id, "CENSORING", "DOMAIN_LIST_ALLOWED")
         full_message_list = Configuration.get_var(member.guild.id, "CENSORING", "FULL_MESSAGE_LIST")
         censor_emoji_message = Configuration.get_var(member.guild.id, "CENSORING", "CENSOR_EMOJI_ONLY_MESSAGES")
-        content = content.replace('\\', '')
+        features = MessageFeatures.get_features(message_id, content)
+        content = features.content
         decoded_content = parse.unquote(content)
 
         if len(guilds) != 0:
             codes = INVITE_MATCHER.findall(decoded_content)
-            for code in codes:
-                try:
-                    invite: discord.Invite = await self.bot.fetch_invite(code)
-                except discord.NotFound:
+            for code in dict.fromkeys(codes):
+                invite = await InviteCache.resolve(self.bot, code)
+                if not invite.valid:
                     await self.censor_invite(member, message_id, channel, code, "INVALID INVITE", content, edit, reply, attachments)
                     return
-                if invite.guild is None:
+                if invite.guild_id is None:
                     await self.censor_invite(member, message_id, channel, code, "DM group", content, edit, reply, attachments)
                     return
                 else:
-                    if invite.guild is None or (not invite.guild.id in guilds and invite.guild.id != member.guild.id):
-                        await self.censor_invite(member, message_id, channel, code, invite.guild.name, content, edit, reply, attachments)
+                    if not invite.guild_id in guilds and invite.guild_id != member.guild.id:
+                        await self.censor_invite(member, message_id, channel, code, invite.guild_name, content, edit, reply, attachments)
                         return
 
-        content = content.lower()
+        content = features.lower
 
-        for bad in full_message_list:
-            if fnmatch.fnmatchcase(content, bad.lower()):
+        if len(full_message_list) > 0:
+            if MatcherRegistry.get_token_matcher(member.guild.id, "CENSORING", "FULL_MESSAGE_LIST", True).find(content) is not None:
                 await self.censor_message(message_id, content, channel, member, "", "_content", edit=edit, reply=reply, attachments=attachments)
                 return
 
-        for bad in censorlist:
-            if fnmatch.fnmatchcase(content, f'*{bad.lower()}*'):
+        if len(censorlist) > 0:
+            bad = MatcherRegistry.get_token_matcher(member.guild.id, "CENSORING", "TOKEN_CENSORLIST").find(content)
+            if bad is not None:
                 await self.censor_message(message_id, content, channel, member, bad, edit=edit, reply=reply, attachments=attachments)
                 return
 
         if len(word_censorlist) > 0:
-            if channel.guild.id not in self.regexes:
-                regex = re.compile(r"(?:\b| )(" + '|'.join(re.escape(word) for word in word_censorlist) + r")(?:\b| )", re.IGNORECASE| re.MULTILINE)
-                self.regexes[channel.guild.id] = regex
-            else:
-                regex = self.regexes[channel.guild.id]
+            regex = MatcherRegistry.get_word_matcher(member.guild.id, "CENSORING", "WORD_CENSORLIST")
             match = regex.findall(content)
             if len(match):
                 await self.censor_message(message_id, content, channel, member, match[0], "_word", edit=edit, reply=reply, attachments=attachments)
                 return
 
         if len(domain_list) > 0:
-            link_list = URL_MATCHER.findall(content)
-            for link in link_list:
+            for link in features.links:
                 url = urlparse(link)
                 domain = url.hostname
                 if (domain in domain_list) is not domains_allowed:
                     await self.censor_message(message_id, content, channel, member, url.hostname, "_domain_blocked", edit=edit, reply=reply, attachments=attachments)
                     return
 
-        if censor_emoji_message and content is not None and len(content) > 0:
-            new_content = ''.join(c for c in content if c not in emoji.UNICODE_EMOJI)
-            new_content = re.sub(EMOJI_REGEX, '', new_content)
-            if new_content == '':
-                await self.censor_message(message_id, content, channel, member, '', "_emoji_only", edit=edit, reply=reply, attachments=attachments)
-                return
+        if censor_emoji_message and features.emoji_only:
+            await self.censor_message(message_id, content, channel, member, '', "_emoji_only", edit=edit, reply=reply, attachments=attachments)
+            return
 
 
 
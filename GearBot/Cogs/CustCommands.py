@@ -3,7 +3,7 @@ from discord import Embed
 from discord.ext import commands
 
 from Cogs.BaseCog import BaseCog
-from Util import Configuration, Confirmation, Emoji, Translator, MessageUtils, Utils, Permissioncheckers, Pages
+from Util import Configuration, Confirmation, Emoji, Translator, MessageUtils, Utils, Permissioncheckers, Pages, ConfigViews
 from database.DatabaseConnector import CustomCommand
 
 
@@ -158,23 +158,18 @@ class CustCommands(BaseCog):
         if not permissions.send_messages:
             return
 
-        role_list = Configuration.get_var(message.guild.id, "CUSTOM_COMMANDS", "ROLES")
+        view = ConfigViews.get(message.guild.id)
         role_required = Configuration.get_var(message.guild.id, "CUSTOM_COMMANDS", "ROLE_REQUIRED")
-        channel_list = Configuration.get_var(message.guild.id, "CUSTOM_COMMANDS", "CHANNELS")
         channels_ignored = Configuration.get_var(message.guild.id, "CUSTOM_COMMANDS", "CHANNELS_IGNORED")
         mod_bypass = Configuration.get_var(message.guild.id, "CUSTOM_COMMANDS", "MOD_BYPASS")
 
         is_mod = message.author is not None and Permissioncheckers.is_mod(message.author)
 
-        if (message.channel.id in channel_list) is not channels_ignored and not (is_mod and mod_bypass):
+        if (message.channel.id in view.command_channels) is not channels_ignored and not (is_mod and mod_bypass):
             return
 
-        has_role = False
-        if message.author is not None and hasattr(message.author, "roles"):
-            for role in message.author.roles:
-                if role.id in role_list:
-                    has_role = True
-                    break
+        has_role = message.author is not None and hasattr(message.author, "roles") and \
+                   not view.command_roles.isdisjoint(role.id for role in message.author.roles)
 
         if has_role is not role_required and not (is_mod and mod_bypass):
             return
@@ -12,7 +12,7 @@ from discord.utils import snowflake_time
 
 from Cogs.BaseCog import BaseCog
 from Util import GearbotLogging, Configuration, Utils, Archive, Emoji, Translator, InfractionUtils, Features, \
-    MessageUtils
+    MessageUtils, ConfigViews
 from Util.Utils import assemble_jumplink
 from database.DatabaseConnector import LoggedMessage, Infraction
 
@@ -74,7 +74,7 @@ class ModLog(BaseCog):
             self.bot.data["message_deletes"].remove(data.message_id)
             return
         c = self.bot.get_channel(data.channel_id)
-        if c is None or isinstance(c, DMChannel) or c.guild is None or (not Features.is_logged(c.guild.id, "MESSAGE_LOGS")) or data.channel_id in Configuration.get_var(c.guild.id, "MESSAGE_LOGS", "IGNORED_CHANNELS_OTHER"):
+        if c is None or isinstance(c, DMChannel) or c.guild is None or (not Features.is_logged(c.guild.id, "MESSAGE_LOGS")) or data.channel_id in ConfigViews.get(c.guild.id).log_ignored_channels:
             return
         message = await MessageUtils.get_message_data(self.bot, data.message_id)
         if message is not None:
@@ -84,7 +84,7 @@ class ModLog(BaseCog):
             guild = self.bot.get_guild(message.server)
             user: discord.User = await Utils.get_user(message.author)
             hasUser = user is not None
-            if not hasUser or user.id in Configuration.get_var(guild.id, "MESSAGE_LOGS", "IGNORED_USERS") or user.id == guild.me.id:
+            if not hasUser or user.id in ConfigViews.get(guild.id).log_ignored_users or user.id == guild.me.id:
                 return
             channel = self.bot.get_channel(message.channel)
             name = Utils.clean_user(user) if hasUser else str(message.author)
@@ -146,7 +146,7 @@ class ModLog(BaseCog):
         if cid == Configuration.get_master_var("BOT_LOG_CHANNEL"):
             return
         c = self.bot.get_channel(cid)
-        if c is None or isinstance(c, DMChannel) or c.guild is None or (not Features.is_logged(c.guild.id, "MESSAGE_LOGS")) or cid in Configuration.get_var(c.guild.id, "MESSAGE_LOGS", "IGNORED_CHANNELS_OTHER"):
+        if c is None or isinstance(c, DMChannel) or c.guild is None or (not Features.is_logged(c.guild.id, "MESSAGE_LOGS")) or cid in ConfigViews.get(c.guild.id).log_ignored_channels:
             return
         message = await MessageUtils.get_message_data(self.bot, event.message_id)
         if message is not None and "content" in event.data:
@@ -185,7 +185,7 @@ class ModLog(BaseCog):
             after = event.data["content"]
             if after is None or after == "":
                 after = f"<{Translator.translate('no_content', channel.guild.id)}>"
-            if hasUser and user.id not in Configuration.get_var(channel.guild.id, "MESSAGE_LOGS", "IGNORED_USERS") and user.id != channel.guild.me.id:
+            if hasUser and user.id not in ConfigViews.get(channel.guild.id).log_ignored_users and user.id != channel.guild.me.id:
                 _time = Utils.to_pretty_time((datetime.datetime.utcnow() - snowflake_time(message.messageid)).total_seconds(), channel.guild.id)
                 with_id = Configuration.get_var(channel.guild.id, "MESSAGE_LOGS", "MESSAGE_ID")
                 reply_str = ""
@@ -404,17 +404,13 @@ class ModLog(BaseCog):
     @commands.Cog.listener()
     async def on_raw_bulk_message_delete(self, event: discord.RawBulkMessageDeleteEvent):
         if Features.is_logged(event.guild_id, "MESSAGE_LOGS"):
-            if event.channel_id in Configuration.get_var(event.guild_id, "MESSAGE_LOGS", "IGNORED_CHANNELS_OTHER"):
+            if event.channel_id in ConfigViews.get(event.guild_id).log_ignored_channels:
                 return
             if event.channel_id in self.bot.being_cleaned:
                 for mid in event.message_ids:
                     self.bot.being_cleaned[event.channel_id].add(mid)
                 return
-            message_list = dict()
-            for mid in event.message_ids:
-                message = await MessageUtils.get_message_data(self.bot, mid)
-                if message is not None:
-                    message_list[mid] = message
+            message_list = await MessageUtils.get_messages_data(self.bot, event.message_ids)
             if len(message_list) > 0:
                 await Archive.archive_purge(self.bot, event.guild_id,
                                             collections.OrderedDict(sorted(message_list.items())))
@@ -450,7 +446,7 @@ class ModLog(BaseCog):
 
     @commands.Cog.listener()
     async def on_guild_channel_update(self, before, after):
-        if not Features.is_logged(before.guild.id, "CHANNEL_CHANGES") or before.id in Configuration.get_var(before.guild.id, "MESSAGE_LOGS", "IGNORED_CHANNELS_CHANGES"): return
+        if not Features.is_logged(before.guild.id, "CHANNEL_CHANGES") or before.id in ConfigViews.get(before.guild.id).log_ignored_change_channels: return
         timestamp = datetime.datetime.now()
         await self.handle_simple_changes(before, after, "channel_update_simple",
                                          AuditLogAction.channel_update,
@@ -1,10 +1,8 @@
 import asyncio
 import concurrent
 import datetime
-import re
 import time
 import typing
-import fnmatch
 import timeago
 from typing import Optional, Union
 from asyncio import CancelledError
@@ -20,7 +18,8 @@ from tortoise.transactions import in_transaction
 from Bot import TheRealGearBot
 from Cogs.BaseCog import BaseCog
 from Util import Configuration, Utils, GearbotLogging, Pages, InfractionUtils, Emoji, Translator, \
-    Archive, Confirmation, MessageUtils, Questions, ServerInfo, Actions, Permissioncheckers
+    Archive, Confirmation, MessageUtils, Questions, ServerInfo, Actions, Permissioncheckers, MessageFeatures, \
+    MatcherRegistry
 from Util.Actions import ActionFailed
 from Util.Converters import BannedMember, UserID, Reason, Duration, DiscordUser, PotentialID, RoleMode, Guild, \
     RangedInt, Message, RangedIntBan, VerificationLevel, Nickname, ServerMember, TranslatedBadArgument
@@ -39,7 +38,6 @@ class Moderation(BaseCog):
         Pages.register("roles", self.roles_init, self.roles_update)
         Pages.register("mass_failures", self._mass_failures_init, self._mass_failures_update)
 
-        self.regexes = dict()
 
     def cog_unload(self):
         self.running = False
@@ -974,8 +972,7 @@ class Moderation(BaseCog):
     @archive.command()
     async def channel(self, ctx, channel_input: Union[discord.TextChannel, int] = None, amount=5000):
         """archive_channel_help"""
-        if amount > 5000:
-            await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_too_much', ctx)}")
+        if not await Archive.check_amount(ctx, amount):
             return
         if channel_input is None:
             channel_input = ctx.message.channel
@@ -991,16 +988,14 @@ class Moderation(BaseCog):
             return
         if Configuration.get_var(ctx.guild.id, "MESSAGE_LOGS", "ENABLED"):
             async with ctx.typing():
-                messages = await LoggedMessage.filter(server=ctx.guild.id, channel=channel_id).order_by("-messageid").limit(amount).prefetch_related("attachments")
-                await Archive.ship_messages(ctx, messages, Translator.translate(f'archived_channel_count', ctx, count=len(messages), channel=Utils.escape_markdown(channel_name)))
+                await Archive.ship_query(ctx, LoggedMessage.filter(server=ctx.guild.id, channel=channel_id), amount, lambda count: Translator.translate(f'archived_channel_count', ctx, count=count, channel=Utils.escape_markdown(channel_name)))
         else:
             await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_no_edit_logs', ctx)}")
 
     @archive.command()
     async def category(self, ctx, category: discord.CategoryChannel, amount=5000):
         """archive_category_help"""
-        if amount > 5000:
-            await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_too_much', ctx)}")
+        if not await Archive.check_amount(ctx, amount):
             return
         channels = []
         for channel in category.text_channels:
@@ -1012,8 +1007,7 @@ class Moderation(BaseCog):
         if Configuration.get_var(ctx.guild.id, "MESSAGE_LOGS", "ENABLED"):
             for channel in channels:
                 async with ctx.typing():
-                    messages = await LoggedMessage.filter(server=ctx.guild.id, channel=channel.id).order_by("-messageid").limit(amount).prefetch_related("attachments")
-                    await Archive.ship_messages(ctx, messages, Translator.translate(f'archived_category_count', ctx, count=len(messages), channel=Utils.escape_markdown(channel.name), category=Utils.escape_markdown(category.name)))
+                    await Archive.ship_query(ctx, LoggedMessage.filter(server=ctx.guild.id, channel=channel.id), amount, lambda count: Translator.translate(f'archived_category_count', ctx, count=count, channel=Utils.escape_markdown(channel.name), category=Utils.escape_markdown(category.name)))
         else:
             await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_no_edit_logs', ctx)}")
 
@@ -1021,8 +1015,7 @@ class Moderation(BaseCog):
     async def user(self, ctx, user: DiscordUser, amount=100):
         """archive_user_help"""
         user = user.id
-        if amount > 5000:
-            await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_too_much', ctx)}")
+        if not await Archive.check_amount(ctx, amount):
             return
         channel_ids = []
         for channel in ctx.guild.text_channels:
@@ -1030,8 +1023,8 @@ class Moderation(BaseCog):
                 channel_ids.append(channel.id)
         if Configuration.get_var(ctx.guild.id, "MESSAGE_LOGS", "ENABLED"):
             async with ctx.typing():
-                messages = await LoggedMessage.filter(server=ctx.guild.id, author=user, channel__in=channel_ids).order_by("-messageid").limit(amount).prefetch_related("attachments")
-                await Archive.ship_messages(ctx, messages, Translator.translate(f'archived_user_count', ctx, count=len(messages), user=await Utils.username(user)))
+                name = await Utils.username(user)
+                await Archive.ship_query(ctx, LoggedMessage.filter(server=ctx.guild.id, author=user, channel__in=channel_ids), amount, lambda count: Translator.translate(f'archived_user_count', ctx, count=count, user=name))
         else:
             await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_no_edit_logs', ctx)}")
 
@@ -1370,21 +1363,18 @@ class Moderation(BaseCog):
     async def check_for_flagged_words(self, content, guild_id, channel_id, message_id, author=None, *, edited):
         if content is None:
             return
-        content = content.lower()
+        content = MessageFeatures.get_features(message_id, content).lower
         token_list = Configuration.get_var(guild_id, "FLAGGING", "TOKEN_LIST")
         word_list = Configuration.get_var(guild_id, "FLAGGING", "WORD_LIST")
 
-        for bad in token_list:
-            if fnmatch.fnmatchcase(content, f'*{bad.lower()}*'):
+        if len(token_list) > 0:
+            bad = MatcherRegistry.get_token_matcher(guild_id, "FLAGGING", "TOKEN_LIST").find(content)
+            if bad is not None:
                 await self.flag_message(content, bad, guild_id, channel_id, message_id, author, "token")
                 return
 
         if len(word_list) > 0:
-            if guild_id not in self.regexes:
-                regex = re.compile(r"(?:\b| )(" + '|'.join(re.escape(word) for word in word_list) + r")(?:\b| )", re.IGNORECASE)
-                self.regexes[guild_id] = regex
-            else:
-                regex = self.regexes[guild_id]
+            regex = MatcherRegistry.get_word_matcher(guild_id, "FLAGGING", "WORD_LIST")
             match = regex.findall(content)
             if len(match):
                 await self.flag_message(content, match[0], guild_id, channel_id, message_id, author, "word")
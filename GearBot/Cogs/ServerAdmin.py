@@ -1011,8 +1011,6 @@ class ServerAdmin(BaseCog):
                 return
 
             Configuration.set_var(ctx.guild.id, target_cat, target_key, new_list)
-            if ctx.guild.id in self.bot.get_cog("Censor").regexes:
-                del self.bot.get_cog("Censor").regexes[ctx.guild.id]
 
             await MessageUtils.send_to(ctx, 'YES', f'{prefix}_list_set')
 
@@ -1051,8 +1049,6 @@ class ServerAdmin(BaseCog):
             censor_list.append(word)
             await MessageUtils.send_to(ctx, "YES", "word_entry_added", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Censor").regexes:
-                del self.bot.get_cog("Censor").regexes[ctx.guild.id]
 
     @word_censor_list.command("remove")
     async def word_censor_list_remove(self, ctx, *, word: str):
@@ -1064,8 +1060,6 @@ class ServerAdmin(BaseCog):
             censor_list.remove(word)
             await MessageUtils.send_to(ctx, "YES", "word_entry_removed", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Censor").regexes:
-                del self.bot.get_cog("Censor").regexes[ctx.guild.id]
 
     @word_censor_list.command("get")
     async def word_censor_list_get(self, ctx):
@@ -1117,8 +1111,6 @@ class ServerAdmin(BaseCog):
             censor_list.append(word)
             await MessageUtils.send_to(ctx, "YES", "flag_added", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Moderation").regexes:
-                del self.bot.get_cog("Moderation").regexes[ctx.guild.id]
 
 
     @flag_list.command("remove")
@@ -1131,8 +1123,6 @@ class ServerAdmin(BaseCog):
             censor_list.remove(word)
             await MessageUtils.send_to(ctx, "YES", "flag_removed", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Moderation").regexes:
-                del self.bot.get_cog("Moderation").regexes[ctx.guild.id]
 
     @flag_list.command("upload")
     async def flag_list_upload(self, ctx):
@@ -1185,8 +1175,6 @@ class ServerAdmin(BaseCog):
             censor_list.append(word)
             await MessageUtils.send_to(ctx, "YES", "word_flag_added", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Moderation").regexes:
-                del self.bot.get_cog("Moderation").regexes[ctx.guild.id]
 
     @word_flag_list.command("remove")
     async def word_flag_list_remove(self, ctx, *, word: str):
@@ -1198,8 +1186,6 @@ class ServerAdmin(BaseCog):
             censor_list.remove(word)
             await MessageUtils.send_to(ctx, "YES", "word_flag_removed", entry=word)
             Configuration.save(ctx.guild.id)
-            if ctx.guild.id in self.bot.get_cog("Moderation").regexes:
-                del self.bot.get_cog("Moderation").regexes[ctx.guild.id]
 
     @word_flag_list.command("upload")
     async def word_flag_list_upload(self, ctx):
@@ -1613,6 +1599,7 @@ class ServerAdmin(BaseCog):
             if existing[i]["TYPE"] == type:
                 del existing[i]
                 break
+        Configuration.save(ctx.guild.id)
         await ctx.send(f"{Emoji.get_chat_emoji('YES')} {Translator.translate('anti_spam_updated', ctx)}", embed=await self.get_anti_spam_embed(ctx))
 
 
@@ -1,43 +1,159 @@
+import asyncio
 import datetime
+import gzip
 import io
+import os
+import shutil
+import tempfile
 
 import discord
-import pytz
 
-from Util import Utils, GearbotLogging, Translator, Emoji, Configuration
+from Util import Utils, GearbotLogging, Translator, Emoji, Configuration, Features
 
-async def archive_purge(bot, guild_id, messages):
-    channel = bot.get_channel(list(messages.values())[0].channel)
-    out = f"purged at {datetime.datetime.now()} from {channel.name}\n"
-    out += await pack_messages(messages.values(), guild_id)
-    buffer = io.BytesIO()
-    buffer.write(out.encode())
-    GearbotLogging.log_key(guild_id, 'purged_log', count=len(messages), channel=channel.mention, file=(buffer, "purged_messages_archive.txt"))
-
-async def pack_messages(messages, guild_id):
-    out = ""
-    for message in messages:
-        name = await Utils.username(message.author, clean=False)
+
+class ArchiveWriter:
+    """Writes archive lines straight into a buffer that moves to disk once it gets big, and gets gzipped once it gets too big to upload"""
+
+    def __init__(self, guild_id):
+        self.buffer = io.BytesIO()
+        self.path = None
+        self.zipped = None
+        self.timezone = Features.get_timezone(guild_id)
+        self.names = dict()
+        self.count = 0
+        self.size = 0
+        self.compressed = False
+
+    def write(self, text):
+        data = text.encode()
+        if self.zipped is not None:
+            self.zipped.write(data)
+        else:
+            self.buffer.write(data)
+        self.size += len(data)
+        if self.path is None and self.size > Configuration.get_master_var("ARCHIVE_SPOOL_SIZE", 1024 * 1024):
+            # move to disk, a named file so it can be uploaded by path instead of copied around in memory
+            spool, self.path = self.temp_file()
+            spool.write(self.buffer.getbuffer())
+            self.buffer = spool
+
+    @staticmethod
+    def temp_file():
+        fd, path = tempfile.mkstemp(prefix="archive")
+        return open(fd, "w+b"), path
+
+    @property
+    def upload_size(self):
+        # what the file on disk is at, zlib holds back a little until the stream gets closed
+        return self.buffer.tell() if self.compressed else self.size
+
+    async def compress(self):
+        # gzip what we have off the loop, everything after that goes through the gzip stream as it comes in
+        compressed, path = self.temp_file()
+        zipped = gzip.GzipFile(fileobj=compressed, mode="wb", compresslevel=6)
+        self.buffer.seek(0)
+        await asyncio.get_running_loop().run_in_executor(None, shutil.copyfileobj, self.buffer, zipped)
+        self.close()
+        self.buffer = compressed
+        self.path = path
+        self.zipped = zipped
+        self.compressed = True
+
+    async def get_name(self, user_id):
+        # archives are usually a handful of people talking a lot, only look each of them up once
+        name = self.names.get(user_id)
+        if name is None:
+            name = await Utils.username(user_id, clean=False)
+            self.names[user_id] = name
+        return name
+
+    async def add(self, message):
+        name = await self.get_name(message.author)
         reply = ""
         if message.reply_to is not None:
             reply = f" | In reply to https://discord.com/channels/{message.server}/{message.channel}/{message.reply_to}"
-        timestamp = datetime.datetime.strftime(discord.Object(message.messageid).created_at.astimezone(pytz.timezone(Configuration.get_var(guild_id, 'GENERAL', 'TIMEZONE'))),'%H:%M:%S')
-        out += f"{timestamp} {message.server} - {message.channel} - {message.messageid} | {name} ({message.author}) | {message.content}{reply} | {(', '.join(Utils.assemble_attachment(message.channel, attachment.id, attachment.name) for attachment in message.attachments))}\r\n"
-    return out
-
-async def ship_messages(ctx, messages, response_content):
-    if len(messages) > 0:
-        message_list = dict()
-        for message in messages:
-            message_list[message.messageid] = message
-        messages = []
-        for mid, message in sorted(message_list.items()):
-            messages.append(message)
-        out = await pack_messages(messages, ctx.guild.id)
-        buffer = io.BytesIO()
-        buffer.write(out.encode())
-        buffer.seek(0)
-        file = discord.File(fp=buffer, filename="message_archive.txt")
-        await ctx.send(f"{Emoji.get_chat_emoji('YES')} {response_content}", file=file)
-    else:
-        await ctx.send(f"{Emoji.get_chat_emoji('WARNING')} {response_content}")
+        timestamp = datetime.datetime.strftime(discord.Object(message.messageid).created_at.astimezone(self.timezone), '%H:%M:%S')
+        self.write(f"{timestamp} {message.server} - {message.channel} - {message.messageid} | {name} ({message.author}) | {message.content}{reply} | {(', '.join(Utils.assemble_attachment(message.channel, attachment.id, attachment.name) for attachment in message.attachments))}\r\n")
+        self.count += 1
+        # too big to upload as is? gzip it, text compresses well
+        if not self.compressed and self.size > Configuration.get_master_var("ARCHIVE_COMPRESS_THRESHOLD", 7 * 1024 * 1024):
+            await self.compress()
+
+    def finish(self):
+        """The archive to upload, the path once it's on disk and the buffer itself while it's small"""
+        if self.zipped is not None:
+            # only writes out what zlib was still holding on to
+            self.zipped.close()
+            self.zipped = None
+        self.buffer.flush()
+        self.buffer.seek(0)
+        return self.buffer if self.path is None else self.path
+
+    def filename(self, name):
+        return f"{name}.txt.gz" if self.compressed else f"{name}.txt"
+
+    def close(self):
+        if self.zipped is not None:
+            self.zipped.close()
+            self.zipped = None
+        self.buffer.close()
+        if self.path is not None:
+            # anything still uploading it has its own handle open
+            os.remove(self.path)
+            self.path = None
+
+
+async def archive_purge(bot, guild_id, messages):
+    channel = bot.get_channel(list(messages.values())[0].channel)
+    writer = ArchiveWriter(guild_id)
+    try:
+        writer.write(f"purged at {datetime.datetime.now()} from {channel.name}\n")
+        for message in messages.values():
+            await writer.add(message)
+        # the logger opens the file for every target before returning
+        GearbotLogging.log_key(guild_id, 'purged_log', count=len(messages), channel=channel.mention, file=(writer.finish(), writer.filename("purged_messages_archive")))
+    finally:
+        writer.close()
+
+async def check_amount(ctx, amount):
+    maximum = Configuration.get_master_var("ARCHIVE_MAX_MESSAGES", 100000)
+    if amount > maximum:
+        await ctx.send(f"{Emoji.get_chat_emoji('NO')} {Translator.translate('archive_too_much', ctx, max=maximum)}")
+        return False
+    return True
+
+async def ship_query(ctx, query, amount, response_content):
+    """Streams the newest amount messages matching the query out oldest first, response_content gets the final count"""
+    page_size = Configuration.get_master_var("ARCHIVE_PAGE_SIZE", 1000)
+    # discord takes 8MB per upload, leave some room for the last message and what zlib holds back
+    part_size = Configuration.get_master_var("ARCHIVE_PART_SIZE", 7 * 1024 * 1024)
+    # find the oldest message that still makes the cut, from there on we can walk up the index a page at a time
+    boundary = await query.order_by("-messageid").offset(amount - 1).limit(1).values_list("messageid", flat=True) if amount > 0 else []
+    after = boundary[0] - 1 if len(boundary) > 0 else 0
+    count = 0
+    part = 1
+    writer = ArchiveWriter(ctx.guild.id)
+    try:
+        while count < amount:
+            page = await query.filter(messageid__gt=after).order_by("messageid").limit(min(page_size, amount - count)).prefetch_related("attachments")
+            if len(page) == 0:
+                break
+            for message in page:
+                await writer.add(message)
+                if writer.upload_size > part_size:
+                    # too big for a single upload, even compressed, send what we have and start a new part
+                    await ctx.send(file=discord.File(fp=writer.finish(), filename=writer.filename(f"message_archive_part{part}")))
+                    writer.close()
+                    writer = ArchiveWriter(ctx.guild.id)
+                    part += 1
+            count += len(page)
+            after = page[-1].messageid
+        if count == 0:
+            await ctx.send(f"{Emoji.get_chat_emoji('WARNING')} {response_content(count)}")
+        elif writer.count == 0:
+            await ctx.send(f"{Emoji.get_chat_emoji('YES')} {response_content(count)}")
+        else:
+            file = discord.File(fp=writer.finish(), filename=writer.filename("message_archive" if part == 1 else f"message_archive_part{part}"))
+            await ctx.send(f"{Emoji.get_chat_emoji('YES')} {response_content(count)}", file=file)
+    finally:
+        writer.close()
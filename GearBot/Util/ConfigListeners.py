@@ -0,0 +1,13 @@
+# functions to call with the guild id whenever a guild config gets (re)loaded or changed, so modules that cache things
+# derived from it can drop them. imports nothing, so Configuration and the modules registering here can both use it
+LISTENERS = []
+
+
+def register(listener):
+    if listener not in LISTENERS:
+        LISTENERS.append(listener)
+
+
+def notify(guild_id):
+    for listener in LISTENERS:
+        listener(guild_id)
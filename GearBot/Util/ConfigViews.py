@@ -0,0 +1,141 @@
+from Util import Configuration, ConfigListeners
+
+PERMISSION_TYPES = ("LVL4", "ADMIN", "MOD", "TRUSTED")
+
+# guild id -> GuildView, dropped whenever the config gets loaded or saved and rebuilt on the next lookup
+VIEWS = dict()
+# section name -> Section subclass with a slot per key the template has for it, built from the template
+SECTION_TYPES = dict()
+GUILD_CONFIG_TYPE = None
+
+
+class Section:
+    """A config section with a slot per template key instead of a dict, still reads and writes like one"""
+    __slots__ = ("_extra",)
+    KEYS = ()
+
+    def __init__(self, values):
+        # anything the template doesn't know about (yet) goes in a dict on the side so it still gets saved
+        self._extra = None
+        for key, value in values.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [key for key in self.KEYS if hasattr(self, key)]
+        if self._extra is not None:
+            keys.extend(self._extra.keys())
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        return {key: value.to_dict() if isinstance(value, Section) else value for key, value in self.items()}
+
+
+class GuildConfig(Section):
+    """The config of a guild, sections the template has fixed keys for get turned into their Section type"""
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        section_type = SECTION_TYPES.get(key)
+        if section_type is not None and isinstance(value, dict):
+            value = section_type(value)
+        super().__setitem__(key, value)
+
+
+def build_types(template):
+    global GUILD_CONFIG_TYPE
+    SECTION_TYPES.clear()
+    for name, section in template.items():
+        # sections keyed by ids or cog names (LOG_CHANNELS, PERM_OVERRIDES) stay dicts
+        if isinstance(section, dict) and len(section) > 0 and all(key.isidentifier() for key in section.keys()):
+            SECTION_TYPES[name] = type(name.title().replace("_", ""), (Section,), {"__slots__": tuple(section.keys()), "KEYS": frozenset(section.keys())})
+    keys = tuple(key for key in template.keys() if key.isidentifier())
+    GUILD_CONFIG_TYPE = type("GuildConfig", (GuildConfig,), {"__slots__": keys, "KEYS": frozenset(keys)})
+
+
+def compact(config):
+    """Turns a parsed json config into its compact form"""
+    if GUILD_CONFIG_TYPE is None:
+        return config
+    return GUILD_CONFIG_TYPE(config)
+
+
+def to_dict(config):
+    return config.to_dict() if isinstance(config, Section) else config
+
+
+class GuildView:
+    """Frozen copies of the id lists from a guild config that get checked on every message or event"""
+    __slots__ = ("permission_roles", "permission_users", "log_ignored_channels", "log_ignored_change_channels",
+                 "log_ignored_users", "command_roles", "command_channels", "allowed_invites")
+
+    def __init__(self, config):
+        permissions = config.get("PERMISSIONS", {})
+        self.permission_roles = {t: frozenset(permissions.get(f"{t}_ROLES", [])) for t in PERMISSION_TYPES}
+        self.permission_users = {t: frozenset(permissions.get(f"{t}_USERS", [])) for t in PERMISSION_TYPES}
+        message_logs = config.get("MESSAGE_LOGS", {})
+        self.log_ignored_channels = frozenset(message_logs.get("IGNORED_CHANNELS_OTHER", []))
+        self.log_ignored_change_channels = frozenset(message_logs.get("IGNORED_CHANNELS_CHANGES", []))
+        self.log_ignored_users = frozenset(message_logs.get("IGNORED_USERS", []))
+        custom_commands = config.get("CUSTOM_COMMANDS", {})
+        self.command_roles = frozenset(custom_commands.get("ROLES", []))
+        self.command_channels = frozenset(custom_commands.get("CHANNELS", []))
+        self.allowed_invites = frozenset(config.get("CENSORING", {}).get("ALLOWED_INVITE_LIST", []))
+
+
+def get(guild_id):
+    view = VIEWS.get(guild_id)
+    if view is None:
+        # goes through get_var so configs that aren't loaded yet get loaded
+        Configuration.get_var(guild_id, "PERMISSIONS")
+        view = VIEWS[guild_id] = GuildView(Configuration.SERVER_CONFIGS[guild_id])
+    return view
+
+
+def invalidate(guild_id):
+    VIEWS.pop(guild_id, None)
+
+
+ConfigListeners.register(invalidate)
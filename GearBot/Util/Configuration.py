@@ -1,3 +1,14 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from discord.ext import commands
+
+from Util import GearbotLogging, Utils, Features, ConfigViews, ConfigListeners
+from database import DatabaseConnector
+
 MASTER_CONFIG = dict()
 SERVER_CONFIGS = dict()
 MASTER_LOADED = False
@@ -5,6 +16,9 @@ PERSISTENT_LOADED = False
 CONFIG_VERSION = 0
 PERSISTENT = dict()
 TEMPLATE = dict()
+PERSISTENT_KEY = "persistent"
+# guild id (or PERSISTENT_KEY) -> timer for the write that will pick up all changes made until then
+WRITE_TIMERS = dict()
 
 
 def save_master():
@@ -35,12 +49,7 @@ def get_master_var(key, default=None):
     return MASTER_CONFIG[key]
 
 
-import json
-import os
-
-from discord.ext import commands
-
-from Util import GearbotLogging, Utils, Features
+WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config-writer")
 
 
 def initial_migration(config):
@@ -390,35 +399,240 @@ MIGRATORS = [initial_migration, v2, v3, v4, v5, v6, v7, v8, v9, v10, v11, v12, v
 
 BOT = None
 
+class FileStorage:
+    """One json file per guild in the config folder"""
+    lazy = True
+
+    def read(self, guild):
+        # only touches the disk, safe to call from a worker thread
+        return Utils.fetch_from_disk(f'config/{guild}')
+
+    def __init__(self):
+        self.readers = ThreadPoolExecutor(max_workers=get_master_var("CONFIG_WARMUP_THREADS", 8), thread_name_prefix="config")
+        # configs from before a migration, written by the writer thread ahead of the next config write
+        self.backups = []
+
+    async def read_many(self, guild_ids):
+        loop = asyncio.get_running_loop()
+        configs = await asyncio.gather(*[loop.run_in_executor(self.readers, self.read, guild_id) for guild_id in guild_ids])
+        return dict(zip(guild_ids, configs))
+
+    async def write(self, guild, version, data):
+        backups = self.backups
+        self.backups = []
+        try:
+            # single worker so writes to the same file can't overtake each other
+            await asyncio.get_running_loop().run_in_executor(WRITER, self.write_files, backups, guild, data)
+        except Exception:
+            self.backups = backups + self.backups
+            raise
+
+    def write_now(self, guild, data):
+        # for scripts without a loop, blocks until it's on disk
+        backups = self.backups
+        self.backups = []
+        self.write_files(backups, guild, data)
+
+    @staticmethod
+    def write_files(backups, guild, data):
+        # backups go first so a migrated config never lands without the one it was made from
+        for backup_guild, version, backup in backups:
+            os.makedirs(f"config/backups/v{version}", exist_ok=True)
+            Utils.write_atomic(f"config/backups/v{version}/{backup_guild}.json", backup)
+        Utils.write_atomic(f"config/{guild}.json", data)
+
+    def backup(self, guild, version, config):
+        # serialized now as the migrations change the config in place, the disk is left to the writer thread
+        self.backups.append((guild, version, json.dumps(config, skipkeys=True, separators=(',', ':'))))
+
+
+class SQLStorage:
+    """All guild configs in a single table, so a whole shard can be loaded with a handful of queries"""
+    lazy = False
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # configs from before a migration, saved along with the next write so they're in before the migrated one
+        self.backups = []
+
+    def read(self, guild):
+        # can't block the loop on the database, get_var has to make do with a placeholder until load_async is done
+        return None
+
+    async def read_many(self, guild_ids):
+        configs = {guild_id: dict() for guild_id in guild_ids}
+        for i in range(0, len(guild_ids), 1000):
+            rows = await DatabaseConnector.GuildConfig.filter(guild_id__in=guild_ids[i:i + 1000]).values_list("guild_id", "config")
+            for guild_id, config in rows:
+                configs[guild_id] = json.loads(config)
+        return configs
+
+    async def write(self, guild, version, data):
+        await self.write_many([(guild, version, data)])
+
+    async def write_many(self, rows):
+        async with self.lock:
+            if len(self.backups) > 0:
+                backups = self.backups
+                self.backups = []
+                try:
+                    await self.upsert(DatabaseConnector.GuildConfigBackup, backups)
+                except Exception:
+                    # try them again with the next write, and don't overwrite anything they'd be needed to roll back
+                    self.backups = backups + self.backups
+                    raise
+            await self.upsert(DatabaseConnector.GuildConfig, rows)
+
+    @staticmethod
+    async def upsert(model, rows):
+        # mysql upsert, the database connection is mysql so %s placeholders
+        await model._meta.db.execute_many(
+            f"INSERT INTO {model._meta.db_table} (guild_id, version, config) VALUES (%s, %s, %s) "
+            f"ON DUPLICATE KEY UPDATE version=VALUES(version), config=VALUES(config)",
+            [list(row) for row in rows])
+
+    def backup(self, guild, version, config):
+        # one row per guild and version, serialized now as the migrations change the config in place
+        self.backups.append((guild, version, json.dumps(config, skipkeys=True, separators=(',', ':'))))
+
+
+STORAGE_TYPES = {
+    "file": FileStorage,
+    "sql": SQLStorage
+}
+STORAGE = None
+# guilds that got a stand in config while the real one loads, nothing gets written for these
+PLACEHOLDERS = set()
+# guild id -> set_var/set_cat calls made against a placeholder, applied to the real config once it's there
+PENDING_CHANGES = dict()
+# guild id -> task loading its config
+LOADING = dict()
+
+
+async def migrate_files_to_sql():
+    """Copies every guild config file into the sql table, returns how many got copied"""
+    guild_ids = [int(name[:-5]) for name in os.listdir("config") if name.endswith(".json") and name[:-5].isdigit()]
+    storage = SQLStorage()
+    files = FileStorage()
+    copied = 0
+    for i in range(0, len(guild_ids), 1000):
+        configs = await files.read_many(guild_ids[i:i + 1000])
+        rows = [(guild_id, config.get("VERSION", 0), json.dumps(config, skipkeys=True, separators=(',', ':')))
+                for guild_id, config in configs.items() if len(config) > 0]
+        if len(rows) > 0:
+            await storage.write_many(rows)
+        copied += len(rows)
+        await asyncio.sleep(0)
+    files.readers.shutdown(wait=False)
+    return copied
+
+
+def get_storage():
+    global STORAGE
+    if STORAGE is None:
+        STORAGE = STORAGE_TYPES[get_master_var("CONFIG_STORAGE", "file")]()
+    return STORAGE
+
+
 async def initialize(bot: commands.Bot):
     global CONFIG_VERSION, BOT, TEMPLATE
     BOT = bot
     TEMPLATE = Utils.fetch_from_disk("GearBot/template")
     CONFIG_VERSION = TEMPLATE["VERSION"]
+    ConfigViews.build_types(TEMPLATE)
     GearbotLogging.info(f"Current template config version: {CONFIG_VERSION}")
-    GearbotLogging.info(f"Loading configurations for {len(bot.guilds)} guilds.")
-    for guild in bot.guilds:
-        GearbotLogging.info(f"Loading info for {guild.name} ({guild.id}).")
-        load_config(guild.id)
-        validate_config(guild.id)
+    # (re)load from storage
+    await flush_all()
+    SERVER_CONFIGS.clear()
+    guild_ids = [guild.id for guild in bot.guilds]
+    if get_storage().lazy:
+        # anything needed before the warm up gets to it is loaded on first use
+        GearbotLogging.info(f"Warming up configurations for {len(guild_ids)} guilds in the background.")
+        bot.loop.create_task(warm_up(guild_ids))
+    else:
+        # can't load on demand from here, but it's only a couple of queries
+        await warm_up(guild_ids)
+
+
+async def warm_up(guild_ids):
+    start = time.perf_counter()
+    batch_size = get_master_var("CONFIG_WARMUP_BATCH", 100)
+    loaded = 0
+    for i in range(0, len(guild_ids), batch_size):
+        batch = [guild_id for guild_id in guild_ids[i:i + batch_size] if guild_id not in SERVER_CONFIGS or guild_id in PLACEHOLDERS]
+        # reading and parsing happens in the storage, the rest touches shared state so that stays on the loop
+        configs = await get_storage().read_many(batch)
+        for guild_id, config in configs.items():
+            # might have been loaded on demand while we were reading
+            if guild_id not in SERVER_CONFIGS or guild_id in PLACEHOLDERS:
+                apply_config(guild_id, config)
+                loaded += 1
+        await asyncio.sleep(0)
+    GearbotLogging.info(f"Config warm up done, loaded {loaded} configurations in {time.perf_counter() - start:.2f}s.")
 
 
 def load_config(guild):
+    config = get_storage().read(guild)
+    if config is None:
+        GearbotLogging.warn(f"Config for {guild} needed before it was loaded, using defaults until it is")
+        SERVER_CONFIGS[guild] = ConfigViews.compact(Utils.fetch_from_disk("GearBot/template"))
+        PLACEHOLDERS.add(guild)
+        asyncio.get_event_loop().create_task(load_async(guild))
+    else:
+        apply_config(guild, config)
+
+
+def is_loaded(guild):
+    return guild in SERVER_CONFIGS and guild not in PLACEHOLDERS
+
+
+async def load_async(guild):
+    if is_loaded(guild):
+        return
+    # everything that needs this guild at the same time waits on the same read
+    task = LOADING.get(guild)
+    if task is None:
+        task = LOADING[guild] = asyncio.ensure_future(read_async(guild))
+        task.add_done_callback(lambda _: LOADING.pop(guild, None))
+    await asyncio.shield(task)
+
+
+async def read_async(guild):
+    config = (await get_storage().read_many([guild]))[guild]
+    if not is_loaded(guild):
+        apply_config(guild, config)
+
+
+def apply_config(guild, config):
     global SERVER_CONFIGS
-    config = Utils.fetch_from_disk(f'config/{guild}')
+    was_placeholder = guild in PLACEHOLDERS
+    PLACEHOLDERS.discard(guild)
     if len(config.keys()) != 0 and "VERSION" not in config and len(config) < 15:
         GearbotLogging.info(f"The config for {guild} is to old to migrate, resetting")
         config = dict()
     elif len(config.keys()) != 0:
         if "VERSION" not in config:
             config["VERSION"] = 0
-        SERVER_CONFIGS[guild] = update_config(guild, config)
+        migrated = config["VERSION"] < CONFIG_VERSION
+        SERVER_CONFIGS[guild] = ConfigViews.compact(update_config(guild, config))
+        if migrated:
+            schedule_write(guild)
     if len(config.keys()) == 0:
         GearbotLogging.info(f"No config available for {guild}, creating a blank one.")
-        SERVER_CONFIGS[guild] = Utils.fetch_from_disk("GearBot/template")
+        SERVER_CONFIGS[guild] = ConfigViews.compact(Utils.fetch_from_disk("GearBot/template"))
         save(guild)
+    changes = PENDING_CHANGES.pop(guild, None)
+    if was_placeholder and changes is not None:
+        GearbotLogging.info(f"Applying {len(changes)} config changes for {guild} that were made while it was loading")
+        for cat, key, value in changes:
+            if key is None:
+                SERVER_CONFIGS[guild][cat] = value
+            else:
+                SERVER_CONFIGS[guild].get(cat, dict())[key] = value
+        schedule_write(guild)
     validate_config(guild)
     Features.check_server(guild)
+    ConfigListeners.notify(guild)
 
 
 def validate_config(guild_id):
@@ -447,17 +661,18 @@ def checklist(guid, key, getter):
 
 
 def update_config(guild, config):
-    while config["VERSION"] < CONFIG_VERSION:
-        v = config["VERSION"]
-        GearbotLogging.info(f"Upgrading config version from version {v} to {v + 1}")
-        d = f"config/backups/v{v}"
-        if not os.path.isdir(d):
-            os.makedirs(d)
-        Utils.save_to_disk(f"{d}/{guild}", config)
+    if config["VERSION"] < CONFIG_VERSION:
+        GearbotLogging.info(f"Upgrading config for {guild} from version {config['VERSION']} to {CONFIG_VERSION}")
+        # one backup of what we started from, all steps in memory and the caller writes the result once
+        get_storage().backup(guild, config["VERSION"], config)
+        migrate(config, CONFIG_VERSION)
+    return config
+
+
+def migrate(config, target):
+    while config["VERSION"] < target:
         MIGRATORS[config["VERSION"]](config)
         config["VERSION"] += 1
-        Utils.save_to_disk(f"config/{guild}", config)
-
     return config
 
 
@@ -465,7 +680,7 @@ def get_var(id, section, key=None, default=None):
     if id is None:
         raise ValueError("Where is this coming from?")
     if not id in SERVER_CONFIGS.keys():
-        GearbotLogging.info(f"Config entry requested before config was loaded for guild {id}, loading config for it")
+        GearbotLogging.debug(f"Config entry requested before config was loaded for guild {id}, loading config for it")
         load_config(id)
     s = SERVER_CONFIGS[id].get(section, {})
     if key is not None:
@@ -475,21 +690,28 @@ def get_var(id, section, key=None, default=None):
 
 def set_var(id, cat, key, value):
     SERVER_CONFIGS[id].get(cat, dict())[key] = value
+    queue_change(id, cat, key, value)
     save(id)
     Features.check_server(id)
 
 
 def set_cat(id, cat, value):
     SERVER_CONFIGS[id][cat] = value
+    queue_change(id, cat, None, value)
     save(id)
     Features.check_server(id)
 
 
+def queue_change(id, cat, key, value):
+    if id in PLACEHOLDERS:
+        # the placeholder gets thrown away, redo this on the real config when it arrives
+        PENDING_CHANGES.setdefault(id, []).append((cat, key, value))
+
+
 def save(id):
-    global SERVER_CONFIGS
-    with open(f'config/{id}.json', 'w') as jsonfile:
-        jsonfile.write(json.dumps(SERVER_CONFIGS[id], indent=4, skipkeys=True, sort_keys=True))
+    schedule_write(id)
     Features.check_server(id)
+    ConfigListeners.notify(id)
 
 
 def load_persistent():
@@ -506,4 +728,54 @@ def get_persistent_var(key, default):
 
 def set_persistent_var(key, value):
     PERSISTENT[key] = value
-    Utils.save_to_disk("config/persistent", PERSISTENT)
+    schedule_write(PERSISTENT_KEY)
+
+
+def serialize(key):
+    # done on the loop so we get a consistent snapshot, without the whitespace it is a lot cheaper to produce as well
+    return json.dumps(PERSISTENT if key == PERSISTENT_KEY else ConfigViews.to_dict(SERVER_CONFIGS[key]), skipkeys=True, separators=(',', ':'))
+
+
+def schedule_write(key):
+    if key in PLACEHOLDERS:
+        # not the real config, don't overwrite the real one with it
+        if key not in PENDING_CHANGES:
+            GearbotLogging.warn(f"Config for {key} was changed while it was still loading, the change will not be kept")
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # no loop (scripts working on the config files), just write it
+        if key == PERSISTENT_KEY:
+            Utils.write_atomic("config/persistent.json", serialize(key))
+        elif isinstance(get_storage(), FileStorage):
+            get_storage().write_now(key, serialize(key))
+        else:
+            raise RuntimeError(f"Can't write the config for {key} to {type(get_storage()).__name__} without a running loop")
+        return
+    # a bunch of changes in a row only needs one write at the end
+    if key not in WRITE_TIMERS:
+        WRITE_TIMERS[key] = loop.call_later(get_master_var("CONFIG_WRITE_DELAY", 2), lambda: loop.create_task(write(key)))
+
+
+async def write(key):
+    WRITE_TIMERS.pop(key, None)
+    if key != PERSISTENT_KEY and (key not in SERVER_CONFIGS or key in PLACEHOLDERS):
+        return
+    data = serialize(key)
+    try:
+        if key == PERSISTENT_KEY:
+            await asyncio.get_running_loop().run_in_executor(WRITER, Utils.write_atomic, "config/persistent.json", data)
+        else:
+            await get_storage().write(key, SERVER_CONFIGS[key]["VERSION"], data)
+    except Exception as ex:
+        GearbotLogging.exception(f"Failed to write config {key}", ex)
+        # try again later rather than losing the changes
+        schedule_write(key)
+
+
+async def flush_all():
+    keys = list(WRITE_TIMERS.keys())
+    for key in keys:
+        WRITE_TIMERS[key].cancel()
+    await asyncio.gather(*[write(key) for key in keys])
@@ -14,7 +14,7 @@ async def generate_command_list(bot, message):
     ctx = await bot.get_context(message)
     ctx.prefix = "!"
     bot.help_command.context = ctx
-    for code in Translator.LANGS.keys():
+    for code in Translator.LANG_NAMES.keys():
         page = ""
         handled = set()
         for cog in sorted(bot.cogs):
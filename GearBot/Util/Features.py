@@ -1,17 +1,51 @@
-from Util import Configuration
+import pytz
+
+from Util import Configuration, GearbotLogging
 
 LOG_MAP = dict()
+# guild id -> log key -> tuple of channel ids it goes to, keys without any channels are left out
+LOG_ROUTES = dict()
+TIMEZONES = dict()
 
 
 def check_server(guild_id):
     enabled = set()
-    for cid, info in Configuration.get_var(guild_id, "LOG_CHANNELS").items():
+    channels = Configuration.get_var(guild_id, "LOG_CHANNELS")
+    for cid, info in channels.items():
         enabled.update(info["CATEGORIES"])
+    routes = dict()
+    for key, info in GearbotLogging.LOG_TYPES.items():
+        targets = tuple(cid for cid, settings in channels.items() if info.category in settings["CATEGORIES"] and info.config_key not in settings["DISABLED_KEYS"])
+        if len(targets) > 0:
+            routes[key] = targets
     LOG_MAP[guild_id] = enabled
+    LOG_ROUTES[guild_id] = routes
+    TIMEZONES.pop(guild_id, None)
+
+
+def get_log_targets(guild_id, key):
+    routes = LOG_ROUTES.get(guild_id)
+    if routes is None:
+        # config isn't loaded yet, loading it builds the routes
+        Configuration.get_var(guild_id, "LOG_CHANNELS")
+        routes = LOG_ROUTES.get(guild_id, dict())
+    return routes.get(key, ())
+
+
+def get_timezone(guild_id):
+    timezone = TIMEZONES.get(guild_id)
+    if timezone is None:
+        timezone = TIMEZONES[guild_id] = pytz.timezone(Configuration.get_var(guild_id, 'GENERAL', 'TIMEZONE'))
+    return timezone
 
 
 def is_logged(guild, feature):
-    return guild in LOG_MAP and feature in LOG_MAP[guild]
+    enabled = LOG_MAP.get(guild)
+    if enabled is None:
+        # config isn't loaded yet (warm up didn't get to it), loading it builds the map
+        Configuration.get_var(guild, "LOG_CHANNELS")
+        enabled = LOG_MAP.get(guild, ())
+    return feature in enabled
 
 
 requires_logging = {
@@ -1,20 +1,20 @@
+import asyncio
 import io
 import logging
 import sys
+import time
 import traceback
-from collections import namedtuple
+from collections import namedtuple, deque
 from concurrent.futures import CancelledError
 from datetime import datetime
-from queue import Queue
 
 import discord
-import pytz
 from aiohttp import ClientOSError, ServerDisconnectedError
 from discord import ConnectionClosed, AllowedMentions
 from discord.ext import commands
 
 from Bot import TheRealGearBot
-from Util import Configuration, Utils, MessageUtils
+from Util import Configuration, Utils, MessageUtils, Features
 
 LOGGER = logging.getLogger('gearbot')
 DISCORD_LOGGER = logging.getLogger('discord')
@@ -275,8 +275,21 @@ LOGGING_INFO = {
 }
 
 LOG_TYPES = dict()
+# built right away so the log routing can be worked out as soon as configs get loaded
+for cat, info in LOGGING_INFO.items():
+    for k, v in info.items():
+        if isinstance(v, dict):
+            for inner, emoji in v.items():
+                LOG_TYPES[inner] = log_type(k, cat, emoji)
+        else:
+            LOG_TYPES[k] = log_type(k, cat, v)
 
+# channel id -> asyncio.Queue of todos, only exists while there is a pump draining it
 LOG_QUEUE = dict()
+# channel id -> counters for that channel, kept around between pumps
+LOG_STATS = dict()
+# guild id -> (second, timezone, formatted timestamp) of the last timestamp handed out
+STAMPS = dict()
 
 
 def before_send(event, hint):
@@ -319,14 +332,6 @@ async def initialize(bot: commands.Bot, channelID):
             await e
         STARTUP_ERRORS = []
 
-    for cat, info in LOGGING_INFO.items():
-        for k, v in info.items():
-            if isinstance(v, dict):
-                for inner, emoji in v.items():
-                    LOG_TYPES[inner] = log_type(k, cat, emoji)
-            else:
-                LOG_TYPES[k] = log_type(k, cat, v)
-
 
 def debug(message):
     LOGGER.debug(message)
@@ -362,126 +367,226 @@ async def bot_log(message=None, embed=None):
 
 
 def log_raw(guild_id, key, message=None, embed=None, file=None):
-    # logging category, emoji and
-    info = LOG_TYPES[key]
-
     # determine where it should be logged so we don't need to bother assembling everything when it's just gona be voided anyways
-    targets = []
-    channels = Configuration.get_var(guild_id, "LOG_CHANNELS")
-    for cid, settings in channels.items():
-        if info.category in settings["CATEGORIES"] and info.config_key not in settings["DISABLED_KEYS"]:
-            targets.append(cid)
+    targets = Features.get_log_targets(guild_id, key)
 
     # no targets? no logging
     if len(targets) == 0:
         return
     if message is None:
-        log_to(guild_id, targets, None, embed, file, None)
+        log_to(guild_id, targets, None, embed, file)
         return
     for chunk in Utils.chunk_message(message, 2000):
-        log_to(guild_id, targets, chunk, embed, file, None)
-
+        log_to(guild_id, targets, chunk, embed, file)
 
-def log_key(guild_id, key, embed=None, file=None, can_stamp=True, tag_on=None, timestamp=datetime.now(), **kwargs):
-    # logging category, emoji and
-    info = LOG_TYPES[key]
 
+def log_key(guild_id, key, embed=None, file=None, can_stamp=True, tag_on=None, timestamp=None, **kwargs):
     # determine where it should be logged so we don't need to bother assembling everything when it's just gona be voided anyways
-    targets = []
-    channels = Configuration.get_var(guild_id, "LOG_CHANNELS")
-    for cid, settings in channels.items():
-        if info.category in settings["CATEGORIES"] and info.config_key not in settings["DISABLED_KEYS"]:
-            targets.append(cid)
+    targets = Features.get_log_targets(guild_id, key)
 
     # no targets? don't bother with assembly
     if len(targets) == 0:
         return
 
-    message = MessageUtils.assemble(guild_id, info.emoji, key, **kwargs).replace('@', '@\u200b')
+    stamp = get_stamp(guild_id, timestamp) if can_stamp and Configuration.get_var(guild_id, 'GENERAL', "TIMESTAMPS") else None
+
+    # queuing up, the pump puts the actual message together when it gets to it
+    log_to(guild_id, targets, PendingLog(guild_id, key, stamp, tag_on, kwargs), embed, file)
+
+
+class PendingLog:
+    __slots__ = ("guild_id", "key", "stamp", "tag_on", "kwargs", "assembled")
+
+    def __init__(self, guild_id, key, stamp, tag_on, kwargs):
+        self.guild_id = guild_id
+        self.key = key
+        self.stamp = stamp
+        self.tag_on = tag_on
+        self.kwargs = kwargs
+        self.assembled = None
+
+    def assemble(self):
+        # shared between all the channels it goes to, only put it together once
+        if self.assembled is None:
+            self.assembled = self.build()
+        return self.assembled
+
+    def build(self):
+        message = MessageUtils.assemble(self.guild_id, LOG_TYPES[self.key].emoji, self.key, **self.kwargs).replace('@', '@\u200b')
+
+        if self.stamp is not None:
+            message = Utils.trim_message(f'{self.stamp} {message}', 2000)
 
-    if can_stamp and Configuration.get_var(guild_id, 'GENERAL', "TIMESTAMPS"):
-        s = datetime.strftime(
-            timestamp.now().astimezone(pytz.timezone(Configuration.get_var(guild_id, 'GENERAL', 'TIMEZONE'))),
-            '%H:%M:%S')
-        stamp = f"[`{s}`] "
-        message = Utils.trim_message(f'{stamp} {message}', 2000)
+        tag_on = self.tag_on
+        if tag_on is not None:
+            tag_on = tag_on.replace('@', '@\u200b')
 
-    if tag_on is not None:
-        tag_on = tag_on.replace('@', '@\u200b')
+        if tag_on is not None and len(message) + len(tag_on) <= 1998:
+            message = f"{message} {tag_on}"
+            tag_on = None
 
-    if tag_on is not None and len(message) + len(tag_on) <= 1998:
-        message = f"{message} {tag_on}"
-        tag_on = None
+        return Utils.trim_message(message, 2000), tag_on
 
-    message = Utils.trim_message(message, 2000)
-    # queuing up
-    log_to(guild_id, targets, message, embed, file, tag_on)
 
+def get_stamp(guild_id, timestamp=None):
+    second = int(time.time() if timestamp is None else timestamp.timestamp())
+    timezone = Features.get_timezone(guild_id)
+    # busy guilds log many lines within the same second, only format it once
+    cached = STAMPS.get(guild_id)
+    if cached is not None and cached[0] == second and cached[1] is timezone:
+        return cached[2]
+    stamp = f"[`{datetime.fromtimestamp(second, timezone).strftime('%H:%M:%S')}`] "
+    STAMPS[guild_id] = (second, timezone, stamp)
+    return stamp
 
-def log_to(guild_id, targets, message, embed, file, tag_on=None):
+
+def log_to(guild_id, targets, message, embed, file):
     for target in targets:
-        # make sure we have a queue and a running task
+        # make sure we have a queue and a running pump
         if target not in LOG_QUEUE:
-            LOG_QUEUE[target] = Queue()
-            BOT.loop.create_task(log_task(guild_id, target))
+            LOG_QUEUE[target] = asyncio.Queue(maxsize=Configuration.get_master_var("LOG_QUEUE_SIZE", 500))
+            BOT.loop.create_task(log_pump(guild_id, target))
+        stats = get_log_stats(guild_id, target)
+        queue = LOG_QUEUE[target]
+
+        if queue.full():
+            # the channel can't keep up (ratelimits, discord having a bad day), shed load rather than pile it up
+            stats["dropped"] += 1
+            continue
 
-        # duplicate the file bytes so it doesn't freak out when we try to send it twice
+        # every target gets its own file object so they don't trip over each other when sent at the same time
         f = None
         if file is not None:
-            buffer = file[0]
-            name = file[1]
-            buffer.seek(0)
-            b2 = io.BytesIO()
-            for line in buffer.readlines():
-                b2.write(line)
-            b2.seek(0)
-            f = discord.File(b2, name)
+            source, name = file
+            if isinstance(source, str):
+                # on disk, open it again rather than pulling the whole thing into memory for every target
+                # our own handle, discord.File would close one it opened itself after the first attempt and break retries
+                f = discord.File(open(source, "rb"), name)
+            else:
+                source.seek(0)
+                f = discord.File(io.BytesIO(source.read()), name)
 
         # actually adding to the queue
-        if tag_on is None:
-            LOG_QUEUE[target].put(todo(message, embed, f))
-        else:
-            LOG_QUEUE[target].put(todo(message, None, None))
-            LOG_QUEUE[target].put(todo(tag_on, embed, f))
-
-
-async def log_task(guild_id, target):
-    to_send = ""
-    todo = None
+        queue.put_nowait(todo(message, embed, f))
+        stats["queued"] += 1
+
+
+def get_log_stats(guild_id, target):
+    stats = LOG_STATS.get(target)
+    if stats is None:
+        stats = LOG_STATS[target] = {"guild": guild_id, "queued": 0, "sent": 0, "messages": 0, "retries": 0, "dropped": 0}
+    return stats
+
+
+def take_log(queue, ready):
+    if len(ready) > 0:
+        return ready.popleft()
+    item = queue.get_nowait()
+    if not isinstance(item.message, PendingLog):
+        return item
+    message, tag_on = item.message.assemble()
+    if tag_on is None:
+        return todo(message, item.embed, item.file)
+    # didn't fit, the tag on goes in a message of its own together with the attachments
+    ready.append(todo(tag_on, item.embed, item.file))
+    return todo(message, None, None)
+
+
+async def log_pump(guild_id, target):
+    queue = LOG_QUEUE[target]
+    stats = get_log_stats(guild_id, target)
+    ready = deque()
+    content = None
     # keep pumping until we run out of messages
-    while not LOG_QUEUE[target].empty():
+    while len(ready) > 0 or not queue.empty():
         try:
             channel = BOT.get_channel(int(target))
             # channel no longer exists, abort and re-validate config to remove the invalid entry
             if channel is None:
-                del LOG_QUEUE[target]
+                drop_queue(target, ready)
                 Configuration.validate_config(guild_id)
                 return
-            # pull message from queue
-            todo = LOG_QUEUE[target].get(block=False)
-            if (len(to_send) + len(todo.message) if todo.message is not None else 0) < 2000:
-                to_send = f'{to_send}\n{todo.message if todo.message is not None else ""}'
-            else:
-                # too large, send it out
-                await channel.send(to_send, allowed_mentions=AllowedMentions(everyone=False, users=False, roles=False))
-                to_send = todo.message
-            if todo.embed is not None or todo.file is not None or LOG_QUEUE[target].empty():
-                await channel.send(to_send, embed=todo.embed, file=todo.file, allowed_mentions=AllowedMentions(everyone=False, users=False, roles=False))
-                to_send = ""
+            item = take_log(queue, ready)
+            content = item.message
+            count = 1
+            # glue as many lines together as fit in a single message, stop at anything with an attachment
+            while item.embed is None and item.file is None and (len(ready) > 0 or not queue.empty()):
+                next_item = take_log(queue, ready)
+                if content is not None and next_item.message is not None and len(content) + len(next_item.message) + 1 > 2000:
+                    ready.appendleft(next_item)
+                    break
+                content = next_item.message if content is None else content if next_item.message is None else f"{content}\n{next_item.message}"
+                item = next_item
+                count += 1
+            if content is None and item.embed is None and item.file is None:
+                continue
+            try:
+                await send_log(stats, channel, content, item.embed, item.file)
+            finally:
+                if item.file is not None:
+                    close_file(item.file)
+            stats["sent"] += 1
+            stats["messages"] += count
         except discord.Forbidden:
             # someone screwed up their permissions, not my problem, will show an error in the dashboard
-            del LOG_QUEUE[target]
+            drop_queue(target, ready)
             return
         except CancelledError:
             return  # bot is terminating
         except Exception as e:
-            del LOG_QUEUE[target]
-            await TheRealGearBot.handle_exception("LOG PUMP", BOT, e,
-                                                  cid=target, todo=todo, to_send=to_send)
-            return
+            # give up on this message but keep the rest of the queue
+            stats["dropped"] += 1
+            await TheRealGearBot.handle_exception("LOG PUMP", BOT, e, cid=target, to_send=content)
     del LOG_QUEUE[target]
 
 
+async def send_log(stats, channel, content, embed, file):
+    attempts = Configuration.get_master_var("LOG_SEND_ATTEMPTS", 5)
+    for attempt in range(attempts):
+        try:
+            return await channel.send(content, embed=embed, file=file, allowed_mentions=AllowedMentions(everyone=False, users=False, roles=False))
+        except discord.HTTPException as ex:
+            # ratelimits and discord side errors are worth another try, anything else won't get better
+            if (ex.status != 429 and ex.status < 500) or attempt == attempts - 1:
+                raise
+        except (ClientOSError, ServerDisconnectedError, asyncio.TimeoutError):
+            if attempt == attempts - 1:
+                raise
+        stats["retries"] += 1
+        if file is not None:
+            file.reset()
+        await asyncio.sleep(min(2 ** attempt, 30))
+
+
+def drop_queue(target, ready):
+    queue = LOG_QUEUE.pop(target)
+    LOG_STATS[target]["dropped"] += queue.qsize() + len(ready)
+    while len(ready) > 0 or not queue.empty():
+        item = ready.popleft() if len(ready) > 0 else queue.get_nowait()
+        if item.file is not None:
+            close_file(item.file)
+
+
+def close_file(file):
+    # discord.File only closes what it opened itself, these handles are ours
+    file.close()
+    file.fp.close()
+
+
+def describe_log_queues(limit=10):
+    totals = {key: sum(stats[key] for stats in LOG_STATS.values()) for key in ("queued", "sent", "messages", "retries", "dropped")}
+    out = f"Active pumps: {len(LOG_QUEUE)}\nBacklog: {sum(queue.qsize() for queue in LOG_QUEUE.values())}\n" \
+          f"Queued: {totals['queued']}\nSent: {totals['messages']} lines in {totals['sent']} messages\n" \
+          f"Retries: {totals['retries']}\nDropped: {totals['dropped']}"
+    backlog = sorted(LOG_QUEUE.items(), key=lambda item: item[1].qsize(), reverse=True)[:limit]
+    if len(backlog) > 0:
+        out += "\n\nBiggest backlogs:"
+        for target, queue in backlog:
+            stats = LOG_STATS[target]
+            out += f"\n{stats['guild']} - {target}: {queue.qsize()} queued, {stats['dropped']} dropped, {stats['retries']} retries"
+    return out
+
+
 async def send_error_log(bot, message):
     channel = bot.get_channel(Configuration.get_master_var("BOT_LOG_CHANNEL"))
     await channel.send(message)
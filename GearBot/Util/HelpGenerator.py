@@ -1,11 +1,71 @@
 import collections
 
+from discord import Member
 from discord.ext.commands import CommandError, Context, GroupMixin
 
-from Util import Utils, Pages, Translator
+from Util import Utils, Pages, Translator, Configuration, Permissioncheckers, ConfigListeners
+
+# (guild id or None for DMs, query, level, language, prefix, bot permissions in the guild and channel, can manage emoji)
+# -> (generation, pages), least recently used get evicted first
+PAGES = collections.OrderedDict()
+# guild id -> generation, bumping it drops all cached pages of the guild
+GENERATIONS = dict()
 
 
 async def command_list(bot, ctx:Context):
+    return await get_pages(bot, ctx, None, generate_command_list)
+
+
+async def gen_cog_help(bot, ctx, cog):
+    return await get_pages(bot, ctx, cog, generate_cog_help, cog)
+
+
+async def gen_command_help(bot, ctx, command):
+    return await get_pages(bot, ctx, command.qualified_name, generate_command_help, command)
+
+
+async def get_pages(bot, ctx, query, generator, *args):
+    key = get_cache_key(bot, ctx, query)
+    if key is None:
+        return await generator(bot, ctx, *args)
+    generation = GENERATIONS.get(key[0], 0)
+    cached = PAGES.get(key)
+    if cached is not None and cached[0] == generation:
+        PAGES.move_to_end(key)
+        return cached[1]
+    pages = await generator(bot, ctx, *args)
+    PAGES[key] = (generation, pages)
+    PAGES.move_to_end(key)
+    while len(PAGES) > Configuration.get_master_var("HELP_CACHE_SIZE", 5000):
+        PAGES.popitem(last=False)
+    return pages
+
+
+def get_cache_key(bot, ctx, query):
+    # everything that decides which commands can run, anyone that gets special treatment doesn't share pages
+    if ctx is None or ctx.author.id in Configuration.get_master_var("BOT_ADMINS", []):
+        return None
+    guild = ctx.guild
+    if guild is None:
+        return None, query, 0, Translator.DEFAULT_LANG, ctx.prefix, 0, 0, False
+    if not isinstance(ctx.author, Member) or guild.id in bot.missing_guilds or Permissioncheckers.is_whitelisted(guild.id, ctx.author.id):
+        return None
+    return (guild.id, query, Permissioncheckers.get_user_lvl(guild, ctx.author), Translator.get_guild_lang(guild.id), ctx.prefix,
+            ctx.me.guild_permissions.value, ctx.channel.permissions_for(ctx.me).value, ctx.channel.permissions_for(ctx.author).manage_emojis)
+
+
+def invalidate(guild_id):
+    GENERATIONS[guild_id] = GENERATIONS.get(guild_id, 0) + 1
+
+
+ConfigListeners.register(invalidate)
+
+
+def cogs_changed():
+    PAGES.clear()
+
+
+async def generate_command_list(bot, ctx:Context):
     command_tree = dict()
     longest = 0
     for cog in bot.cogs:
@@ -61,7 +121,7 @@ async def gen_commands_list(bot, ctx, list):
         return None, None
 
 
-async def gen_cog_help(bot, ctx, cog):
+async def generate_cog_help(bot, ctx, cog):
     commands, longest = await cog_commands(bot, ctx, cog)
     output = f'- {cog}\n'
     if commands is not None:
@@ -69,7 +129,7 @@ async def gen_cog_help(bot, ctx, cog):
             output += command_name + (" " * (longest - len(command_name) + 4)) + info + "\n"
     return [output]
 
-async def gen_command_help(bot, ctx, command):
+async def generate_command_help(bot, ctx, command):
     if ctx is None:
         return []
     if ctx.prefix is None:
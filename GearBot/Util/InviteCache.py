@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import namedtuple, OrderedDict
+
+import discord
+
+from Util import Configuration
+
+# valid is False for invites that don't exist (anymore), guild_id is None for group DM invites
+ResolvedInvite = namedtuple("ResolvedInvite", "valid guild_id guild_name")
+INVALID = ResolvedInvite(False, None, None)
+
+LOCAL_CACHE = OrderedDict()
+LOCAL_CACHE_SIZE = 10000
+IN_FLIGHT = dict()
+STATS = {
+    "hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "invalid": 0
+}
+
+
+def get_ttl(resolved):
+    if resolved.valid:
+        return Configuration.get_master_var("INVITE_CACHE_TTL", 3600)
+    # invites can be created at any time, don't remember missing ones for too long
+    return Configuration.get_master_var("INVITE_CACHE_NEGATIVE_TTL", 300)
+
+
+async def get_cached(bot, code):
+    if bot.redis_pool is not None:
+        info = await bot.redis_pool.hgetall(f"invites:{code}")
+        if len(info) == 0:
+            return None
+        if info["valid"] != "1":
+            return INVALID
+        if info["guild_id"] == "":
+            return ResolvedInvite(True, None, None)
+        return ResolvedInvite(True, int(info["guild_id"]), info["guild_name"])
+    else:
+        entry = LOCAL_CACHE.get(code)
+        if entry is None:
+            return None
+        expires, resolved = entry
+        if expires <= time.time():
+            del LOCAL_CACHE[code]
+            return None
+        return resolved
+
+
+async def store(bot, code, resolved):
+    ttl = get_ttl(resolved)
+    if bot.redis_pool is not None:
+        pipeline = bot.redis_pool.pipeline()
+        pipeline.hmset_dict(f"invites:{code}",
+                            valid=int(resolved.valid),
+                            guild_id=resolved.guild_id if resolved.guild_id is not None else "",
+                            guild_name=resolved.guild_name if resolved.guild_name is not None else "")
+        pipeline.expire(f"invites:{code}", ttl)
+        await pipeline.execute()
+    else:
+        LOCAL_CACHE[code] = (time.time() + ttl, resolved)
+        LOCAL_CACHE.move_to_end(code)
+        if len(LOCAL_CACHE) > LOCAL_CACHE_SIZE:
+            LOCAL_CACHE.popitem(last=False)
+
+
+async def fetch(bot, code):
+    try:
+        invite = await bot.fetch_invite(code)
+    except discord.NotFound:
+        STATS["invalid"] += 1
+        resolved = INVALID
+    else:
+        if invite.guild is None:
+            resolved = ResolvedInvite(True, None, None)
+        else:
+            resolved = ResolvedInvite(True, invite.guild.id, invite.guild.name)
+    await store(bot, code, resolved)
+    return resolved
+
+
+async def resolve(bot, code):
+    resolved = await get_cached(bot, code)
+    if resolved is not None:
+        STATS["hits"] += 1
+        return resolved
+    # during invite raids the same code shows up in many messages at once, only ask discord once
+    task = IN_FLIGHT.get(code)
+    if task is not None:
+        STATS["coalesced"] += 1
+        return await asyncio.shield(task)
+    STATS["misses"] += 1
+    task = asyncio.ensure_future(fetch(bot, code))
+    IN_FLIGHT[code] = task
+    task.add_done_callback(lambda _: IN_FLIGHT.pop(code, None))
+    # shielded so one impatient caller getting cancelled doesn't cancel the lookup for everyone else
+    return await asyncio.shield(task)
+
+
+def describe():
+    total = STATS["hits"] + STATS["misses"] + STATS["coalesced"]
+    rate = (STATS["hits"] + STATS["coalesced"]) / total * 100 if total > 0 else 0
+    return f"Invite lookups: {total}\nCache hits: {STATS['hits']}\nCoalesced: {STATS['coalesced']}\n" \
+           f"Fetched: {STATS['misses']} ({STATS['invalid']} invalid)\nHit rate: {rate:.1f}%\n" \
+           f"Local entries: {len(LOCAL_CACHE)}\nIn flight: {len(IN_FLIGHT)}"
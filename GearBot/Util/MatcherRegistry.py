@@ -0,0 +1,92 @@
+import hashlib
+import re
+from collections import OrderedDict
+
+from Util import Configuration, ConfigListeners
+from Util.TokenMatcher import TokenMatcher
+
+# compiled matchers, keyed on (guild, section, key, digest of the list) and evicted least recently used first
+MATCHERS = OrderedDict()
+# (guild, section, key) -> digest of the list as it was last seen, dropped whenever the config of the guild changes
+DIGESTS = dict()
+
+
+def list_digest(entries):
+    return hashlib.sha1("\n".join(entries).encode()).hexdigest()
+
+
+def build_trie_pattern(words):
+    trie = dict()
+    for word in words:
+        node = trie
+        for c in word.lower():
+            node = node.setdefault(c, dict())
+        node[None] = True
+    return trie_to_pattern(trie)
+
+
+def trie_to_pattern(root):
+    # shared prefixes only get tried once, so matching time depends on the word length rather than the list length
+    # children before their parents with a stack of our own, recursing a level per character overflows on long words
+    patterns = dict()
+    stack = [(root, False)]
+    while len(stack) > 0:
+        node, expanded = stack.pop()
+        children = sorted((c, child) for c, child in node.items() if c is not None)
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for c, child in children)
+            continue
+        branches = [re.escape(c) + patterns.pop(id(child)) for c, child in children]
+        if len(branches) == 0:
+            pattern = ""
+        elif len(branches) == 1 and None not in node:
+            pattern = branches[0]
+        else:
+            group = f"(?:{'|'.join(branches)})"
+            pattern = f"{group}?" if None in node else group
+        patterns[id(node)] = pattern
+    return patterns[id(root)]
+
+
+def build_word_matcher(words):
+    return re.compile(r"(?:\b| )(" + build_trie_pattern(words) + r")(?:\b| )", re.IGNORECASE | re.MULTILINE)
+
+
+def get_matcher(guild_id, section, key, builder):
+    lookup = (guild_id, section, key)
+    entries = Configuration.get_var(guild_id, section, key)
+    digest = DIGESTS.get(lookup)
+    if digest is None:
+        digest = list_digest(entries)
+        DIGESTS[lookup] = digest
+    cache_key = (guild_id, section, key, digest)
+    matcher = MATCHERS.get(cache_key)
+    if matcher is None:
+        matcher = builder(entries)
+        MATCHERS[cache_key] = matcher
+        while len(MATCHERS) > Configuration.get_master_var("MATCHER_CACHE_SIZE", 1000):
+            evicted = MATCHERS.popitem(last=False)[0]
+            # the digest goes with it, otherwise these pile up for every guild that ever had a list
+            if DIGESTS.get(evicted[:3]) == evicted[3]:
+                del DIGESTS[evicted[:3]]
+    else:
+        MATCHERS.move_to_end(cache_key)
+    return matcher
+
+
+def get_token_matcher(guild_id, section, key, full_message=False):
+    return get_matcher(guild_id, section, key, lambda entries: TokenMatcher(entries, full_message))
+
+
+def get_word_matcher(guild_id, section, key):
+    return get_matcher(guild_id, section, key, build_word_matcher)
+
+
+def invalidate(guild_id):
+    # unchanged lists hash the same so their matchers get picked up again, changed ones age out of the cache
+    for lookup in [lookup for lookup in DIGESTS.keys() if lookup[0] == guild_id]:
+        del DIGESTS[lookup]
+
+
+ConfigListeners.register(invalidate)
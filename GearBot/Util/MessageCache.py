@@ -0,0 +1,89 @@
+import sys
+from collections import OrderedDict
+
+from Util import Configuration
+
+
+class CachedMessage:
+    __slots__ = ("messageid", "author", "content", "channel", "server", "attachments", "type", "pinned", "reply_to",
+                 "size")
+
+    def __init__(self, messageid, author, content, channel, server, attachments, type, pinned, reply_to):
+        self.messageid = messageid
+        self.author = author
+        self.content = content
+        self.channel = channel
+        self.server = server
+        self.attachments = attachments
+        self.type = type
+        self.pinned = pinned
+        self.reply_to = reply_to
+        self.size = self.estimate_size()
+
+    def estimate_size(self):
+        # rough, but close enough to keep the cache within its budget: the object itself, its ints and the strings
+        return ENTRY_OVERHEAD + sys.getsizeof(self.content) + \
+               sum(ATTACHMENT_OVERHEAD + sys.getsizeof(a.name) for a in self.attachments)
+
+
+# slots object + ints + the OrderedDict entry pointing to it
+ENTRY_OVERHEAD = 400
+ATTACHMENT_OVERHEAD = 120
+
+CACHE = OrderedDict()
+STATS = {
+    "size": 0,
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0
+}
+
+
+def get_budget():
+    return Configuration.get_master_var("MESSAGE_CACHE_MB", 64) * 1024 * 1024
+
+
+def get(message_id):
+    message = CACHE.get(message_id)
+    if message is None:
+        STATS["misses"] += 1
+        return None
+    STATS["hits"] += 1
+    CACHE.move_to_end(message_id)
+    return message
+
+
+def add(message):
+    old = CACHE.pop(message.messageid, None)
+    if old is not None:
+        STATS["size"] -= old.size
+    CACHE[message.messageid] = message
+    STATS["size"] += message.size
+    trim()
+
+
+def update(message_id, content, pinned):
+    message = CACHE.get(message_id)
+    if message is None:
+        return
+    STATS["size"] -= message.size
+    message.content = content
+    message.pinned = pinned
+    message.size = message.estimate_size()
+    STATS["size"] += message.size
+    trim()
+
+
+def trim():
+    budget = get_budget()
+    while STATS["size"] > budget and len(CACHE) > 0:
+        _, message = CACHE.popitem(last=False)
+        STATS["size"] -= message.size
+        STATS["evictions"] += 1
+
+
+def describe():
+    total = STATS["hits"] + STATS["misses"]
+    rate = STATS["hits"] / total * 100 if total > 0 else 0
+    return f"Messages: {len(CACHE)}\nSize: {STATS['size'] / 1024 / 1024:.2f}/{get_budget() / 1024 / 1024:.0f} MB\n" \
+           f"Hits: {STATS['hits']}\nMisses: {STATS['misses']}\nHit rate: {rate:.1f}%\nEvictions: {STATS['evictions']}"
@@ -0,0 +1,116 @@
+import re
+from collections import OrderedDict
+
+import emoji
+
+from Util.Matchers import URL_MATCHER
+
+# everything that needs a regex to be found, newlines are counted separately so a custom emoji with a newline in its
+# "name" doesn't hide them
+TOKEN_MATCHER = re.compile(
+    r"(?P<mention><@[!&]?\d+>)|(?P<custom_emoji><a?:(?:[^:]+):[0-9]+>)|(?P<link>" + URL_MATCHER.pattern[1:-1] + ")",
+    re.IGNORECASE)
+
+# variation selectors and joiners left behind when an emoji is sent in a slightly different form than the emoji
+# package knows it by, they don't count as text
+EMOJI_FILLERS = {"\ufe0f", "\ufe0e", "\u200d"}
+
+
+def build_emoji_trie():
+    trie = dict()
+    for e in emoji.UNICODE_EMOJI_ENGLISH.keys():
+        node = trie
+        for c in e:
+            node = node.setdefault(c, dict())
+        # None marks the end of a full emoji
+        node[None] = True
+    return trie
+
+
+EMOJI_TRIE = build_emoji_trie()
+
+
+class MessageFeatures:
+    __slots__ = ("content", "lower", "newlines", "mentions", "links", "unicode_emoji", "custom_emoji", "emoji_only")
+
+    def __init__(self, content):
+        # escaping doesn't hide anything from moderators
+        content = content.replace('\\', '')
+        self.content = content
+        self.lower = content.lower()
+        self.newlines = content.count("\n")
+        self.mentions = 0
+        self.links = []
+        self.unicode_emoji = 0
+        self.custom_emoji = 0
+        other = 0
+        position = 0
+        for match in TOKEN_MATCHER.finditer(content):
+            other += self.scan_emoji(content, position, match.start())
+            kind = match.lastgroup
+            if kind == "mention":
+                self.mentions += 1
+                other += 1
+            elif kind == "custom_emoji":
+                self.custom_emoji += 1
+            else:
+                self.links.append(match.group())
+                other += 1
+            position = match.end()
+        other += self.scan_emoji(content, position, len(content))
+        self.emoji_only = len(content) > 0 and other == 0
+
+    @property
+    def emoji(self):
+        return self.unicode_emoji + self.custom_emoji
+
+    def scan_emoji(self, content, start, end):
+        # counts the unicode emoji between start and end, returns how many other characters there are
+        if start == end:
+            return 0
+        if content.isascii() or content[start:end].isascii():
+            return end - start
+        other = 0
+        i = start
+        while i < end:
+            node = EMOJI_TRIE.get(content[i])
+            if node is None:
+                if content[i] not in EMOJI_FILLERS:
+                    other += 1
+                i += 1
+                continue
+            # walk the trie for the longest emoji starting here
+            longest = 0
+            j = i + 1
+            if None in node:
+                longest = j
+            while j < end:
+                node = node.get(content[j])
+                if node is None:
+                    break
+                j += 1
+                if None in node:
+                    longest = j
+            if longest == 0:
+                other += 1
+                i += 1
+            else:
+                self.unicode_emoji += 1
+                i = longest
+        return other
+
+
+# the same message passes through anti-spam, censoring and flagging, only take it apart once
+CACHE = OrderedDict()
+CACHE_SIZE = 1000
+
+
+def get_features(message_id, content):
+    key = (message_id, content)
+    features = CACHE.get(key)
+    if features is None:
+        features = MessageFeatures(content)
+        CACHE[key] = features
+        if len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+    return features
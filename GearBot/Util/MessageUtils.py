@@ -6,7 +6,7 @@ from datetime import datetime
 import discord
 from discord import Object, HTTPException, MessageType, AllowedMentions
 
-from Util import Translator, Emoji, Archive
+from Util import Translator, Emoji, Archive, MessageCache
 from database import DBUtils
 from database.DatabaseConnector import LoggedMessage
 
@@ -19,16 +19,76 @@ def is_cache_enabled(bot):
 attachment = namedtuple("attachment", "id name")
 
 async def get_message_data(bot, message_id):
-    message = None
-    if is_cache_enabled(bot) and not Object(message_id).created_at <= datetime.utcfromtimestamp(time.time() - 5 * 60):
-        parts = await bot.redis_pool.hgetall(f"messages:{message_id}")
-        if len(parts) == 7:
-            reply = int(parts["reply"])
-            message = Message(message_id, int(parts["author"]), parts["content"], int(parts["channel"]), int(parts["server"]), [attachment(a.split("/")[0], a.split("/")[1]) for a in parts["attachments"].split("|")] if len(parts["attachments"]) > 0 else [], type=int(parts["type"]) if "type" in parts else None, pinned=parts["pinned"] == '1', reply_to=reply if reply != 0 else None)
+    message = MessageCache.get(message_id)
+    if message is not None:
+        return message
+    message = get_pending_message(message_id)
+    if message is None and is_cache_enabled(bot) and is_recent(message_id):
+        message = parse_redis_message(message_id, await bot.redis_pool.hgetall(f"messages:{message_id}"))
     if message is None:
         message = await LoggedMessage.get_or_none(messageid = message_id).prefetch_related("attachments")
+        if message is not None:
+            apply_pending_edit(message)
     return message
 
+async def get_messages_data(bot, message_ids):
+    # same as get_message_data but for a lot of messages at once: one redis round trip and two queries at most
+    found = dict()
+    missing = []
+    for mid in message_ids:
+        message = MessageCache.get(mid)
+        if message is None:
+            message = get_pending_message(mid)
+        if message is None:
+            missing.append(mid)
+        else:
+            found[mid] = message
+    recent = [mid for mid in missing if is_recent(mid)] if is_cache_enabled(bot) else []
+    if len(recent) > 0:
+        pipe = bot.redis_pool.pipeline()
+        for mid in recent:
+            pipe.hgetall(f"messages:{mid}")
+        for mid, parts in zip(recent, await pipe.execute()):
+            message = parse_redis_message(mid, parts)
+            if message is not None:
+                found[mid] = message
+        missing = [mid for mid in missing if mid not in found]
+    if len(missing) > 0:
+        for message in await LoggedMessage.filter(messageid__in=missing).prefetch_related("attachments"):
+            apply_pending_edit(message)
+            found[message.messageid] = message
+    return found
+
+def is_recent(message_id):
+    return not Object(message_id).created_at <= datetime.utcfromtimestamp(time.time() - 5 * 60)
+
+def parse_redis_message(message_id, parts):
+    if len(parts) != 7:
+        return None
+    reply = int(parts["reply"])
+    return Message(message_id, int(parts["author"]), parts["content"], int(parts["channel"]), int(parts["server"]), [attachment(a.split("/")[0], a.split("/")[1]) for a in parts["attachments"].split("|")] if len(parts["attachments"]) > 0 else [], type=int(parts["type"]) if "type" in parts else None, pinned=parts["pinned"] == '1', reply_to=reply if reply != 0 else None)
+
+def apply_pending_edit(message):
+    edit = DBUtils.get_pending_edit(message.messageid)
+    if edit is not None:
+        # edited but not written back yet
+        message.content, message.pinned = edit
+
+def get_pending_message(message_id):
+    # logged but not written to the database yet
+    pending = DBUtils.get_pending(message_id)
+    if pending is None:
+        return None
+    logged, attachments = pending
+    content, pinned = logged.content, logged.pinned
+    edit = DBUtils.get_pending_edit(message_id)
+    if edit is not None:
+        # edited while its insert is being written, the edit gets written after it
+        content, pinned = edit
+    return Message(logged.messageid, logged.author, content, logged.channel, logged.server,
+                   [attachment(a.id, a.name) for a in attachments], type=logged.type, pinned=pinned,
+                   reply_to=logged.reply_to)
+
 async def insert_message(bot, message, redis=True):
     message_type = message.type
     if message_type == MessageType.default:
@@ -36,9 +96,16 @@ async def insert_message(bot, message, redis=True):
     else:
         if not isinstance(message_type, int):
             message_type = message_type.value
+    is_reply = message.reference is not None and message.reference.channel_id == message.channel.id
+    if redis:
+        # only live messages, rebuilding the logs after downtime shouldn't push them all out
+        MessageCache.add(MessageCache.CachedMessage(message.id, message.author.id, message.content, message.channel.id,
+                                                    message.guild.id,
+                                                    [attachment(a.id, a.filename) for a in message.attachments],
+                                                    message_type, message.pinned,
+                                                    message.reference.message_id if is_reply else None))
     if redis and is_cache_enabled(bot):
         pipe = bot.redis_pool.pipeline()
-        is_reply = message.reference is not None and message.reference.channel_id == message.channel.id
         pipe.hmset_dict(f"messages:{message.id}", author=message.author.id, content=message.content,
                          channel=message.channel.id, server=message.guild.id, pinned=1 if message.pinned else 0, attachments='|'.join((f"{str(a.id)}/{str(a.filename)}" for a in message.attachments)), reply=message.reference.message_id if is_reply else 0)
         if message_type is not None:
@@ -48,23 +115,17 @@ async def insert_message(bot, message, redis=True):
     await DBUtils.insert_message(message)
 
 async def update_message(bot, message_id, content, pinned):
-    if is_cache_enabled(bot) and not Object(message_id).created_at <= datetime.utcfromtimestamp(time.time() - 5 * 60):
-        pipe = bot.redis_pool.pipeline()
-        pipe.hmset_dict(f"messages:{message_id}", content=content)
-        pipe.hmset_dict(f"messages:{message_id}", pinned=(1 if pinned else 0))
-        await pipe.execute()
-    await LoggedMessage.filter(messageid=message_id).update(content=content, pinned=pinned)
+    MessageCache.update(message_id, content, pinned)
+    if is_cache_enabled(bot) and is_recent(message_id):
+        await bot.redis_pool.hmset_dict(f"messages:{message_id}", content=content, pinned=(1 if pinned else 0))
+    await DBUtils.update_message(message_id, content, pinned)
 
 def assemble(destination, emoji, m, translate=True, **kwargs):
     translated = Translator.translate(m, destination, **kwargs) if translate else m
     return f"{Emoji.get_chat_emoji(emoji)} {translated}"
 
 async def archive_purge(bot, id_list, guild_id):
-    message_list = dict()
-    for mid in id_list:
-        message = await get_message_data(bot, mid)
-        if message is not None:
-            message_list[mid] = message
+    message_list = await get_messages_data(bot, id_list)
     if len(message_list) > 0:
         await Archive.archive_purge(bot, guild_id,
                                     collections.OrderedDict(sorted(message_list.items())))
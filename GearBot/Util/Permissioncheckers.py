@@ -1,7 +1,22 @@
+import time
+from collections import OrderedDict
+
 from discord.ext import commands
 from discord.ext.commands import NoPrivateMessage, BotMissingPermissions, CheckFailure
 
-from Util import Configuration, Utils
+from Util import Configuration, Utils, ConfigViews, ConfigListeners
+
+# guild id -> command -> (required level, ids of the people whitelisted for it through the overrides)
+REQUIREMENTS = dict()
+# guild id -> ids of everyone on any command whitelist
+WHITELISTED = dict()
+# command -> required level outside of guilds, only depends on the cog permissions
+DEFAULT_REQUIREMENTS = dict()
+# (guild id, member id) -> (expiry, level from roles and permissions, generation), least recently used get evicted first
+# the guild owner and command whitelists are checked on top
+MEMBER_LEVELS = OrderedDict()
+# guild id -> generation, bumping it drops every cached level of the guild without having to go look for them
+GENERATIONS = dict()
 
 def is_trusted(member):
     return is_user("TRUSTED", member)
@@ -29,16 +44,11 @@ def is_user(perm_type, member):
     if not hasattr(member, "roles"):
         return False
 
-    roles = Configuration.get_var(member.guild.id, "PERMISSIONS", f"{perm_type}_ROLES")
-    users = Configuration.get_var(member.guild.id, "PERMISSIONS", f"{perm_type}_USERS")
-
-    if member.id in users:
+    view = ConfigViews.get(member.guild.id)
+    if member.id in view.permission_users[perm_type]:
         return True
-
-    for role in member.roles:
-        if role.id in roles:
-            return True
-    return False
+    roles = view.permission_roles[perm_type]
+    return len(roles) > 0 and not roles.isdisjoint(role.id for role in member.roles)
 
 
 def mod_only():
@@ -66,16 +76,52 @@ def check_permission(command_object, guild, member, bot):
     if not hasattr(member, '_roles'):
         member = Utils.get_member(bot, guild, member.id)
     if guild is None:
-        return 0 >= get_required(command_object, command_object.cog.permissions)
+        required = DEFAULT_REQUIREMENTS.get(command_object)
+        if required is None:
+            required = DEFAULT_REQUIREMENTS[command_object] = get_required(command_object, command_object.cog.permissions)
+        return 0 >= required
     else:
-        overrides = Configuration.get_var(guild.id, "PERM_OVERRIDES")
-        cog_name = type(command_object.cog).__name__
-        required = -1
-        if cog_name in overrides:
-            required = get_required(command_object, overrides[cog_name])
-        if required == -1:
-            required = get_required(command_object, command_object.cog.permissions)
-        return get_user_lvl(guild, member, command_object) >= (command_object.cog.permissions["required"] if required == -1 else required)
+        return get_user_lvl(guild, member, command_object) >= get_requirement(guild.id, command_object)[0]
+
+
+def get_requirement(guild_id, command_object):
+    requirements = REQUIREMENTS.get(guild_id)
+    if requirements is None:
+        requirements = REQUIREMENTS[guild_id] = dict()
+    requirement = requirements.get(command_object)
+    if requirement is None:
+        requirement = requirements[command_object] = compile_requirement(guild_id, command_object)
+    return requirement
+
+
+def compile_requirement(guild_id, command_object):
+    overrides = Configuration.get_var(guild_id, "PERM_OVERRIDES")
+    cog_name = type(command_object.cog).__name__
+    required = -1
+    people = set()
+    if cog_name in overrides:
+        required = get_required(command_object, overrides[cog_name])
+        target = overrides[cog_name]
+        pieces = get_command_pieces(command_object)
+        while len(pieces) > 0 and "commands" in target and pieces[0] in target["commands"]:
+            target = target["commands"][pieces.pop(0)]
+            people.update(target["people"])
+    if required == -1:
+        required = get_required(command_object, command_object.cog.permissions)
+    return command_object.cog.permissions["required"] if required == -1 else required, frozenset(people)
+
+
+def is_whitelisted(guild_id, member_id):
+    whitelisted = WHITELISTED.get(guild_id)
+    if whitelisted is None:
+        people = set()
+        pending = list(Configuration.get_var(guild_id, "PERM_OVERRIDES").values())
+        while len(pending) > 0:
+            target = pending.pop()
+            people.update(target.get("people", []))
+            pending.extend(target.get("commands", {}).values())
+        whitelisted = WHITELISTED[guild_id] = frozenset(people)
+    return member_id in whitelisted
 
 
 def get_command_pieces(command_object):
@@ -121,31 +167,37 @@ def get_user_lvl(guild, member, command_object=None):
     if guild.owner is not None and guild.owner.id == member.id:
         return 5
 
-    if is_lvl4(member):
+    level = get_member_lvl(guild.id, member)
+    if level < 4 and command_object is not None and member.id in get_requirement(guild.id, command_object)[1]:
         return 4
-
-    if command_object is not None:
-        cog_name = type(command_object.cog).__name__
-        overrides = Configuration.get_var(guild.id, "PERM_OVERRIDES")
-        if cog_name in overrides:
-            target = overrides[cog_name]
-            pieces = get_command_pieces(command_object)
-            while len(pieces) > 0 and "commands" in target and pieces[0] in target["commands"]:
-                target = target["commands"][pieces.pop(0)]
-                if member.id in target["people"]:
-                    return 4
-    if is_admin(member):
-        return 3
-    if is_mod(member):
-        return 2
-    if is_trusted(member):
-        return 1
-    return 0
+    return level
 
 
 def user_lvl(member):
     if member.guild.owner.id == member.id:
         return 5
+    return get_member_lvl(member.guild.id, member)
+
+
+def get_member_lvl(guild_id, member):
+    now = time.perf_counter()
+    key = (guild_id, member.id)
+    generation = GENERATIONS.get(guild_id, 0)
+    cached = MEMBER_LEVELS.get(key)
+    if cached is not None and cached[0] > now and cached[2] == generation:
+        MEMBER_LEVELS.move_to_end(key)
+        return cached[1]
+    level = compute_member_lvl(member)
+    # objects without roles (users outside of the guild) don't get updates, don't hold on to those
+    if hasattr(member, "roles"):
+        MEMBER_LEVELS[key] = (now + Configuration.get_master_var("PERMISSION_CACHE_TTL", 30), level, generation)
+        MEMBER_LEVELS.move_to_end(key)
+        while len(MEMBER_LEVELS) > Configuration.get_master_var("PERMISSION_CACHE_SIZE", 50000):
+            MEMBER_LEVELS.popitem(last=False)
+    return level
+
+
+def compute_member_lvl(member):
     if is_lvl4(member):
         return 4
     if is_admin(member):
@@ -157,6 +209,31 @@ def user_lvl(member):
     return 0
 
 
+def member_updated(before, after):
+    if before.roles != after.roles:
+        MEMBER_LEVELS.pop((after.guild.id, after.id), None)
+
+
+def roles_changed(guild_id):
+    # role permissions feed into every level of the guild
+    GENERATIONS[guild_id] = GENERATIONS.get(guild_id, 0) + 1
+
+
+def cogs_changed():
+    # the tables are keyed on the command objects, reloaded cogs come with new ones
+    REQUIREMENTS.clear()
+    DEFAULT_REQUIREMENTS.clear()
+
+
+def invalidate(guild_id):
+    REQUIREMENTS.pop(guild_id, None)
+    WHITELISTED.pop(guild_id, None)
+    roles_changed(guild_id)
+
+
+ConfigListeners.register(invalidate)
+
+
 def bot_has_guild_permission(**kwargs):
     async def predicate(ctx):
         if ctx.guild is None:
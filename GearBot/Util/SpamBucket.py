@@ -1,56 +1,169 @@
+import hashlib
 import time
+from collections import namedtuple, OrderedDict, deque
+
+from aioredis import ReplyError
+
+from Util import Configuration, GearbotLogging
 
 
 def ms_time():
     return int(time.time() * 1000)
 
 
-class SpamBucket:
+BucketResult = namedtuple("BucketResult", "triggered count span members")
+
+# trims expired entries, adds the new ones, refreshes the ttl and reports back, all in a single round trip
+# KEYS: bucket key
+# ARGV: current time, period, message, amount, expire (1/0), threshold
+BUCKET_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local message = ARGV[3]
+local amount = tonumber(ARGV[4])
+local threshold = tonumber(ARGV[6])
+if ARGV[5] == '1' then
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - period)
+end
+for i = 0, amount - 1 do
+    redis.call('ZADD', key, now, message .. '-' .. i)
+end
+redis.call('EXPIRE', key, period)
+local count = redis.call('ZCARD', key)
+local span = 0
+if count > 1 then
+    local first = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    local last = redis.call('ZRANGE', key, -1, -1, 'WITHSCORES')
+    span = tonumber(last[2]) - tonumber(first[2])
+end
+if count >= threshold then
+    return {count, span, redis.call('ZRANGEBYSCORE', key, '-inf', '+inf')}
+end
+return {count, span, {}}
+"""
+BUCKET_SCRIPT_SHA = hashlib.sha1(BUCKET_SCRIPT.encode()).hexdigest()
+
 
-    def __init__(self, redis, key_format, max_actions, period, extra_actions):
+class RedisBucketStore:
+    """Buckets stored as sorted sets in redis, shared between all processes"""
+
+    def __init__(self, redis):
         self.redis = redis
+
+    async def hit(self, key, current_time, period, message, amount, expire, threshold):
+        args = [current_time, period, message, amount, 1 if expire else 0, threshold]
+        try:
+            count, span, members = await self.redis.evalsha(BUCKET_SCRIPT_SHA, keys=[key], args=args)
+        except ReplyError as ex:
+            if not str(ex).startswith("NOSCRIPT"):
+                raise ex
+            # redis got restarted or flushed its script cache, register it again
+            await self.redis.script_load(BUCKET_SCRIPT)
+            count, span, members = await self.redis.evalsha(BUCKET_SCRIPT_SHA, keys=[key], args=args)
+        return BucketResult(count >= threshold, count, span, set(members))
+
+    async def clear(self, key):
+        await self.redis.unlink(key)
+
+
+class RingBucket:
+    __slots__ = ("entries", "count", "expires")
+
+    def __init__(self):
+        # (timestamp, message, amount) tuples, oldest first
+        self.entries = deque()
+        self.count = 0
+        self.expires = 0
+
+
+class MemoryBucketStore:
+    """Buckets kept in process, only suitable when a single process handles all the shards of a guild"""
+
+    def __init__(self, max_keys=100000, max_entries=512, sweep_interval=60):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0
+
+    async def hit(self, key, current_time, period, message, amount, expire, threshold):
+        now = time.time()
+        if now >= self.next_sweep:
+            self.sweep(now)
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.expires <= now:
+            bucket = RingBucket()
+            self.buckets[key] = bucket
+        # replacing an expired bucket keeps its old spot, so move it either way
+        self.buckets.move_to_end(key)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        entries = bucket.entries
+        if expire:
+            cutoff = current_time - period
+            while len(entries) > 0 and entries[0][0] <= cutoff:
+                bucket.count -= entries.popleft()[2]
+        if amount > 0:
+            if len(entries) >= self.max_entries:
+                bucket.count -= entries.popleft()[2]
+            entries.append((current_time, message, amount))
+            bucket.count += amount
+        bucket.expires = now + period
+
+        count = bucket.count
+        span = entries[-1][0] - entries[0][0] if count > 1 else 0
+        if count < threshold:
+            return BucketResult(False, count, span, set())
+        return BucketResult(True, count, span, {f"{m}-{i}" for (_, m, a) in entries for i in range(a)})
+
+    async def clear(self, key):
+        self.buckets.pop(key, None)
+
+    def sweep(self, now):
+        self.next_sweep = now + self.sweep_interval
+        expired = [key for key, bucket in self.buckets.items() if bucket.expires <= now]
+        for key in expired:
+            del self.buckets[key]
+
+
+MEMORY_STORE = MemoryBucketStore()
+REDIS_STORE = None
+BACKENDS = ("redis", "memory")
+# last unknown backend we complained about, so it doesn't get logged for every message
+INVALID_BACKEND = None
+
+
+def get_store(bot):
+    global REDIS_STORE, INVALID_BACKEND
+    backend = Configuration.get_master_var("ANTI_SPAM_BACKEND", "redis")
+    if backend not in BACKENDS:
+        if backend != INVALID_BACKEND:
+            INVALID_BACKEND = backend
+            GearbotLogging.error(f"Unknown ANTI_SPAM_BACKEND {backend!r} in the master config, expected one of {', '.join(BACKENDS)}. Using redis.")
+        backend = "redis"
+    if backend == "memory" or bot.redis_pool is None:
+        return MEMORY_STORE
+    if REDIS_STORE is None or REDIS_STORE.redis is not bot.redis_pool:
+        REDIS_STORE = RedisBucketStore(bot.redis_pool)
+    return REDIS_STORE
+
+
+class SpamBucket:
+
+    def __init__(self, store, key_format, max_actions, period, extra_actions):
+        self.store = store
         self.key_format = key_format
         self.max_actions = max_actions
         self.period = period
         self.extra_actions = extra_actions
 
     async def incr(self, key, current_time, message, amt=1, expire=True):
-        if expire:
-            await self._remove_expired_keys(key, current_time)
-        k = self.key_format.format(key)
-        for i in range(0, amt):
-            await self.redis.zadd(k, current_time, f"{message}-{i}")
-        await self.redis.expire(k, self.period)
-        return await self.redis.zcount(k)
+        return (await self.check(key, current_time, amt, message, expire)).count
 
     async def check(self, key, current_time, amount, message, expire=True):
-        amt = await self.incr(key, current_time, amt=amount, message=message, expire=expire)
-        return amt >= (self.max_actions + self.extra_actions.count)
-
-    async def count(self, key, current_time, expire=True):
-        if expire:
-            await self._remove_expired_keys(key, current_time)
-        k = self.key_format.format(key)
-        return await self.redis.zcount(k)
-
-    async def get(self, key, current_time, expire=True):
-        if expire:
-            await self._remove_expired_keys(key, current_time)
-        k = self.key_format.format(key)
-        return await self.redis.zrangebyscore(k)
-
-    async def size(self, key, current_time, expire=True):
-        if expire:
-            await self._remove_expired_keys(key, current_time)
-        k = self.key_format.format(key)
-        values = await self.redis.zrangebyscore(k)
-        if len(values) <= 1:
-            return 0
-        return (await self.redis.zscore(k, values[-1])) - (await self.redis.zscore(k, values[0]))
+        return await self.store.hit(self.key_format.format(key), current_time, self.period, message, amount, expire,
+                                    self.max_actions + self.extra_actions.count)
 
     async def clear(self, key):
-        k = self.key_format.format(key)
-        await self.redis.zremrangebyscore(k)
-
-    async def _remove_expired_keys(self, key, current_time):
-        await self.redis.zremrangebyscore(self.key_format.format(key), max=(current_time - self.period))
+        await self.store.clear(self.key_format.format(key))
@@ -0,0 +1,118 @@
+from collections import namedtuple
+
+from Util import Configuration, Translator, ConfigListeners
+
+# store values as functions so only what is needed is computed, they get the shared MessageFeatures of the message
+GENERATORS = {
+    "max_messages": lambda f: 1,
+    "max_newlines": lambda f: f.newlines,
+    "max_mentions": lambda f: f.mentions,
+    "max_links": lambda f: len(f.links),
+    "max_emoji": lambda f: f.emoji
+}
+
+# key_format is handed to the SpamBucket, actions_format still needs the member id to find the extra actions holder
+Rule = namedtuple("Rule", "type check friendly key_format actions_format count period bucket")
+
+
+class RulePlan:
+    __slots__ = ("guild_id", "enabled", "exempt_roles", "exempt_users", "metrics", "message_rules", "duplicates",
+                 "censored", "voice_joins")
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.enabled = False
+        self.exempt_roles = frozenset()
+        self.exempt_users = frozenset()
+        # (type, generator) pairs, each generator runs at most once per message
+        self.metrics = tuple()
+        self.message_rules = tuple()
+        self.duplicates = tuple()
+        self.censored = tuple()
+        self.voice_joins = tuple()
+
+    @property
+    def checks_messages(self):
+        return self.enabled and (len(self.message_rules) > 0 or len(self.duplicates) > 0)
+
+
+PLANS = dict()
+
+
+def get_plan(guild_id):
+    plan = PLANS.get(guild_id)
+    if plan is None:
+        plan = compile_plan(guild_id)
+        PLANS[guild_id] = plan
+    return plan
+
+
+def refresh(guild_id):
+    # only rebuild plans that are in use, everything else gets compiled on first use
+    if guild_id in PLANS:
+        PLANS[guild_id] = compile_plan(guild_id)
+
+
+ConfigListeners.register(refresh)
+
+
+def compile_plan(guild_id):
+    plan = RulePlan(guild_id)
+    config = Configuration.get_var(guild_id, "ANTI_SPAM")
+    plan.enabled = config.get("ENABLED", False)
+    plan.exempt_roles = frozenset(config.get("EXEMPT_ROLES", []))
+    plan.exempt_users = frozenset(config.get("EXEMPT_USERS", []))
+
+    counters = dict()
+    metrics = dict()
+    message_rules = []
+    duplicates = []
+    censored = []
+    voice_joins = []
+    for bucket in config.get("BUCKETS", []):
+        t = bucket["TYPE"]
+        counter = counters.get(t, 0)
+        counters[t] = counter + 1
+        actions_format = f"{guild_id}-{{}}-{t}"
+        count = bucket["SIZE"]["COUNT"]
+        period = bucket["SIZE"]["PERIOD"]
+        if t == "duplicates":
+            # the bucket gets keyed on "author:content"
+            duplicates.append(Rule(t, "max_duplicates", Translator.translate("spam_max_duplicates", guild_id),
+                                   f"spam:duplicates{counter}:{guild_id}:{{}}", actions_format, count, period, bucket))
+        elif t == "censored":
+            censored.append(Rule(t, "max_censored", Translator.translate("spam_max_censored", guild_id),
+                                 f"{guild_id}:censored:{counter}:{{}}", actions_format, count, period, bucket))
+        elif t == "voice_joins":
+            voice_joins.append(Rule(t, "max_voice_joins", Translator.translate("spam_max_voice_join", guild_id),
+                                    f"{guild_id}:voice_channel_join:{{}}", actions_format, count, period, bucket))
+        elif t in GENERATORS:
+            metrics[t] = GENERATORS[t]
+            message_rules.append(Rule(t, f"{t}:{counter}", Translator.translate(f"spam_{t}", guild_id),
+                                      f"{guild_id}:{t}:{counter}:{{}}", actions_format, count, period, bucket))
+
+    plan.metrics = tuple(metrics.items())
+    plan.message_rules = tuple(message_rules)
+    plan.duplicates = tuple(duplicates)
+    plan.censored = tuple(censored)
+    plan.voice_joins = tuple(voice_joins)
+    return plan
+
+
+def describe(plan):
+    lines = [
+        f"Guild: {plan.guild_id}",
+        f"Enabled: {plan.enabled}",
+        f"Exempt roles: {', '.join(str(r) for r in sorted(plan.exempt_roles)) or 'none'}",
+        f"Exempt users: {', '.join(str(u) for u in sorted(plan.exempt_users)) or 'none'}",
+        f"Metrics: {', '.join(t for t, _ in plan.metrics) or 'none'}"
+    ]
+    for section, rules in (("Message rules", plan.message_rules), ("Duplicates", plan.duplicates),
+                           ("Censored", plan.censored), ("Voice joins", plan.voice_joins)):
+        lines.append(f"{section}:")
+        if len(rules) == 0:
+            lines.append("    none")
+        for rule in rules:
+            lines.append(f"    {rule.check}: {rule.count}/{rule.period}s -> {rule.bucket['PUNISHMENT']['TYPE']} "
+                         f"(key {rule.key_format}, {rule.friendly})")
+    return "\n".join(lines)
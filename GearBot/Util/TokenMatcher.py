@@ -0,0 +1,156 @@
+import fnmatch
+import re
+
+
+def split_pattern(pattern):
+    # breaks a glob pattern up in the literal runs between the wildcards, same bracket rules as fnmatch.translate
+    runs = []
+    current = []
+    wildcard = False
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*' or c == '?':
+            wildcard = True
+            runs.append("".join(current))
+            current = []
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                # no closing bracket, fnmatch treats it as a plain character
+                current.append(c)
+            else:
+                wildcard = True
+                runs.append("".join(current))
+                current = []
+                i = j + 1
+        else:
+            current.append(c)
+    runs.append("".join(current))
+    return [run for run in runs if run != ""], wildcard
+
+
+class Automaton:
+    """Plain Aho-Corasick automaton, reports every (value, end position) of every keyword in a single pass"""
+
+    def __init__(self):
+        self.goto = [dict()]
+        self.fail = [0]
+        self.out = [[]]
+        # closest node down the fail chain that has output, saves walking the entire chain for every character
+        self.out_link = [0]
+
+    def add(self, keyword, value):
+        node = 0
+        for c in keyword:
+            nxt = self.goto[node].get(c)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][c] = nxt
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.out.append([])
+                self.out_link.append(0)
+            node = nxt
+        self.out[node].append(value)
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for c, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f != 0 and c not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(c, 0)
+                self.fail[child] = target if target != child else 0
+                fail = self.fail[child]
+                self.out_link[child] = fail if len(self.out[fail]) > 0 else self.out_link[fail]
+
+    def search(self, text):
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        out_link = self.out_link
+        node = 0
+        for position, c in enumerate(text):
+            while node != 0 and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            hit = node if len(out[node]) > 0 else out_link[node]
+            while hit != 0:
+                for value in out[hit]:
+                    yield value, position
+                hit = out_link[hit]
+
+
+class TokenMatcher:
+    """
+    Matches a message against a whole list of fnmatch style patterns at once.
+    Every pattern is indexed in the automaton by its longest literal run, the (few) patterns that get hit are then
+    verified with their own regex. Patterns without any literal to anchor on are always verified.
+    """
+
+    def __init__(self, patterns, full_message=False):
+        self.patterns = list(patterns)
+        self.full_message = full_message
+        self.automaton = Automaton()
+        # literal patterns confirm themselves, everything else needs verification
+        # the regexes only get compiled when first needed, compiling thousands of them up front is what makes building slow
+        self.verifiers = dict()
+        self.compiled = dict()
+        self.unanchored = []
+        self.exact = dict()
+        for index, pattern in enumerate(self.patterns):
+            pattern = pattern.lower()
+            runs, wildcard = split_pattern(pattern)
+            if full_message and not wildcard:
+                self.exact.setdefault(pattern, index)
+                continue
+            if wildcard or len(runs) == 0:
+                self.verifiers[index] = pattern if full_message else f"*{pattern}*"
+            if len(runs) == 0:
+                self.unanchored.append(index)
+            else:
+                self.automaton.add(max(runs, key=len), index)
+        self.automaton.build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def get_verifier(self, index):
+        verifier = self.compiled.get(index)
+        if verifier is None:
+            verifier = re.compile(fnmatch.translate(self.verifiers[index]))
+            self.compiled[index] = verifier
+        return verifier
+
+    def find(self, content):
+        # returns the first pattern (in list order) that matches, same outcome as checking them one by one
+        best = self.exact.get(content)
+        candidates = set(self.unanchored)
+        for index, _ in self.automaton.search(content):
+            if best is not None and index >= best:
+                continue
+            if index in self.verifiers:
+                candidates.add(index)
+            else:
+                best = index
+        for index in sorted(candidates):
+            if best is not None and index >= best:
+                break
+            if self.get_verifier(index).match(content) is not None:
+                best = index
+                break
+        return None if best is None else self.patterns[best]
@@ -1,42 +1,164 @@
+import os
+from importlib.metadata import version
+
+from discord import Guild
 from parsimonious import ParseError, VisitationError
 from pyseeyou import format
+from pyseeyou.grammar import ICUMessageFormat
+from pyseeyou.node_visitor import ICUNodeVisitor
 
-from Util import GearbotLogging, Emoji, Utils
+from Util import GearbotLogging, Emoji, Utils, Configuration, ConfigListeners
 
+DEFAULT_LANG = "en_US"
+# Template leans on pyseeyou's parser and visitor internals, only use it with the version tests/test_translator.py checks
+TEMPLATE_PYSEEYOU = "1.0.2"
 LANGS = dict()
+# lang -> key -> Template, or the plain string when there is nothing to fill in. corrupt ones are left out
+TEMPLATES = dict()
 LANG_NAMES = dict(en_US= "English")
 LANG_CODES = dict(English="en_US")
+# guild id -> language code it's using
+GUILD_LANGS = dict()
 BOT = None
 untranlatable = {None, ''}
 
 async def initialize(bot_in):
     global BOT
     BOT = bot_in
-    for lang in LANG_CODES.values():
-        load_translations(lang)
+    # only see what's there, languages get loaded the first time someone needs them
+    for file in os.listdir("lang"):
+        if file.endswith(".json"):
+            code = file[:-5]
+            if code not in LANG_NAMES:
+                LANG_NAMES[code] = code
+                LANG_CODES[code] = code
+    load_translations(DEFAULT_LANG)
 
 def load_translations(lang):
     LANGS[lang] = Utils.fetch_from_disk(f"lang/{lang}")
+    TEMPLATES[lang] = compile_templates(LANGS[lang])
+
+def get_language(code):
+    if code not in LANGS:
+        if code not in LANG_NAMES:
+            return DEFAULT_LANG
+        load_translations(code)
+    return code
+
+def get_guild_lang(guild_id):
+    lang = GUILD_LANGS.get(guild_id)
+    if lang is None:
+        lang = GUILD_LANGS[guild_id] = get_language(Configuration.get_var(guild_id, "GENERAL", "LANG"))
+    return lang
+
+def get_location_lang(location):
+    if isinstance(location, int):
+        # don't go creating configs for anything that happens to be an id but isn't a guild we're in
+        if location not in GUILD_LANGS and (BOT is None or BOT.get_guild(location) is None):
+            return DEFAULT_LANG
+        return get_guild_lang(location)
+    if isinstance(location, Guild):
+        return get_guild_lang(location.id)
+    guild = getattr(location, "guild", None)
+    if guild is None:
+        return DEFAULT_LANG
+    return get_guild_lang(guild.id)
+
+def invalidate(guild_id):
+    GUILD_LANGS.pop(guild_id, None)
+
+ConfigListeners.register(invalidate)
+
+def compile_templates(strings):
+    # parsing is by far the most expensive part of formatting, do it once instead of for every message
+    templates = dict()
+    if version("pyseeyou") != TEMPLATE_PYSEEYOU:
+        # leaving them all out makes everything go through pyseeyou.format, slower but never wrong
+        GearbotLogging.warn(f"pyseeyou {version('pyseeyou')} isn't {TEMPLATE_PYSEEYOU}, not precompiling translations")
+        return templates
+    for key, message in strings.items():
+        if '{' not in message:
+            templates[key] = message
+            continue
+        try:
+            templates[key] = Template(ICUMessageFormat.parse(message))
+        except ParseError:
+            pass  # reported when it gets used
+    return templates
+
+class Template:
+    """Parsed message, split into plain text, simple {arguments} and the plural/select blocks pyseeyou handles"""
+    __slots__ = ("parts",)
+
+    TEXT = 0
+    ARGUMENT = 1
+    BLOCK = 2
+
+    def __init__(self, tree):
+        parts = []
+        for child in tree.children:
+            node = child.children[0]
+            if node.expr_name != "message_format_element":
+                if len(parts) > 0 and parts[-1][0] == Template.TEXT:
+                    parts[-1] = (Template.TEXT, parts[-1][1] + node.text)
+                else:
+                    parts.append((Template.TEXT, node.text))
+            elif node.children[3].text == "":
+                parts.append((Template.ARGUMENT, node.children[2].text))
+            else:
+                parts.append((Template.BLOCK, node))
+        self.parts = tuple(parts)
+
+    def format(self, kwargs, lang):
+        out = []
+        visitor = None
+        for kind, value in self.parts:
+            if kind == Template.TEXT:
+                out.append(value)
+            elif kind == Template.ARGUMENT:
+                out.append(str(kwargs[value]))
+            else:
+                if visitor is None:
+                    visitor = ICUNodeVisitor(kwargs, lang)
+                item = visitor.visit(value)
+                for name in item:
+                    out.append(str(visitor._get_formed_string(item, name)))
+        return "".join(out)
+
+def format_template(lang_key, key, kwargs):
+    template = TEMPLATES[lang_key].get(key)
+    if template is None:
+        # corrupt (let pyseeyou raise the error for it) or not compiled
+        return format(LANGS[lang_key][key], kwargs, lang_key)
+    if isinstance(template, str):
+        return template
+    return template.format(kwargs, lang_key)
 
 def translate(key, location, **kwargs):
-    lang_key = "en_US"
+    lang_key = get_location_lang(location)
     translated = key
+    if key not in LANGS[lang_key] and key in LANGS[DEFAULT_LANG]:
+        # not translated (yet), english is better than nothing
+        lang_key = DEFAULT_LANG
     if key not in LANGS[lang_key]:
         if key not in untranlatable:
             BOT.loop.create_task(tranlator_log('WARNING', f'Untranslatable string detected in {lang_key}: {key}\n'))
             untranlatable.add(key)
         return key
     try:
-        translated = format(LANGS[lang_key][key], kwargs, lang_key)
+        translated = format_template(lang_key, key, kwargs)
     except (KeyError, ValueError, ParseError, VisitationError) as ex:
         BOT.loop.create_task(tranlator_log('NO', f'Corrupt translation detected!\n**Lang code:** {lang_key}\n**Translation key:** {key}\n```\n{LANGS[lang_key][key]}```'))
         GearbotLogging.exception("Corrupt translation", ex)
     return translated
 
 def translate_by_code(key, code, **kwargs):
+    code = get_language(code)
     if key not in LANGS[code]:
-        return key
-    return format(LANGS[code][key], kwargs, code)
+        if key not in LANGS[DEFAULT_LANG]:
+            return key
+        code = DEFAULT_LANG
+    return format_template(code, key, kwargs)
 
 async def tranlator_log(emoji, message, embed=None):
     m = f'{Emoji.get_chat_emoji(emoji)} {message}'
@@ -14,7 +14,7 @@ from discord import NotFound, DiscordException
 
 from Util import GearbotLogging, Translator, Emoji, Configuration, MessageUtils
 from Util.Matchers import ROLE_ID_MATCHER, CHANNEL_ID_MATCHER, ID_MATCHER, EMOJI_MATCHER, URL_MATCHER
-from database import DatabaseConnector
+from database import DatabaseConnector, DBUtils
 
 BOT = None
 
@@ -36,12 +36,25 @@ def fetch_from_disk(filename, alternative=None):
     return dict()
 
 def save_to_disk(filename, dict):
-    with open(f"{filename}.json", "w", encoding="UTF-8") as file:
-        json.dump(dict, file, indent=4, skipkeys=True, sort_keys=True)
+    write_atomic(f"{filename}.json", json.dumps(dict, skipkeys=True, separators=(',', ':')))
+
+
+def write_atomic(filename, data):
+    # write it next to the real file and swap it in, crashing halfway through leaves the old one intact
+    temp = f"{filename}.tmp"
+    with open(temp, "w", encoding="UTF-8") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, filename)
 
 
 async def cleanExit(bot, trigger):
     await GearbotLogging.bot_log(f"Shutdown triggered by {trigger}.")
+    await Configuration.flush_all()
+    GearbotLogging.info("Wrote pending config changes")
+    await DBUtils.shutdown()
+    GearbotLogging.info("Flushed pending message logs")
     await DatabaseConnector.close()
     GearbotLogging.info("Closed database connection")
     await bot.aiosession.close()
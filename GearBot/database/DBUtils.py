@@ -1,29 +1,257 @@
+import asyncio
+from collections import OrderedDict
+
 from discord import MessageType
 from tortoise import Tortoise
 from tortoise.exceptions import IntegrityError
 from tortoise.transactions import in_transaction
 
+from Util import Configuration, GearbotLogging
 from database.DatabaseConnector import LoggedMessage, LoggedAttachment
 
+# messages waiting to be written: message id -> (LoggedMessage, [LoggedAttachment])
+PENDING = OrderedDict()
+# the batch that is being written right now, still visible to lookups until it's in the database
+FLUSHING = dict()
+# message id -> (content, pinned) of edits that still need to be written, only the last one within a flush window matters
+PENDING_EDITS = OrderedDict()
+# the edits that are being written right now
+FLUSHING_EDITS = dict()
+# failed attempts at writing the batch at the front of the queue, it's dropped once this reaches MESSAGE_BATCH_RETRIES
+ATTEMPTS = {"messages": 0, "edits": 0}
+FLUSH_LOCK = None
+FLUSH_EVENT = None
+FLUSHER = None
+STOPPING = False
+STATS = {
+    "queued": 0,
+    "written": 0,
+    "batches": 0,
+    "overflows": 0,
+    "fallbacks": 0,
+    "failed": 0,
+    "edits": 0,
+    "edits_coalesced": 0,
+    "edits_folded": 0,
+    "edits_written": 0,
+    "edit_batches": 0
+}
+
+
+def initialize(bot):
+    global FLUSH_LOCK, FLUSH_EVENT, FLUSHER, STOPPING
+    if FLUSH_LOCK is None:
+        FLUSH_LOCK = asyncio.Lock()
+        FLUSH_EVENT = asyncio.Event()
+    STOPPING = False
+    if FLUSHER is None or FLUSHER.done():
+        FLUSHER = bot.loop.create_task(flusher())
+
+
+async def shutdown():
+    global FLUSHER, STOPPING
+    if FLUSHER is not None:
+        # let the flusher finish the batch it's on instead of cancelling it halfway through a write
+        STOPPING = True
+        FLUSH_EVENT.set()
+        await FLUSHER
+        FLUSHER = None
+    if FLUSH_LOCK is not None:
+        await flush()
+
+
 async def insert_message(message):
-    try:
-        message_type = message.type
+    message_type = message.type
+
+    if message_type == MessageType.default:
+        message_type = None
+    else:
+        if not isinstance(message_type, int):
+            message_type = message_type.value
+    is_reply = message.reference is not None and message.reference.channel_id == message.channel.id
+    logged = LoggedMessage(messageid=message.id, content=message.content.replace('\x00', ''),
+                           author=message.author.id,
+                           channel=message.channel.id, server=message.guild.id,
+                           type=message_type, pinned=message.pinned,
+                           reply_to=message.reference.message_id if is_reply else None)
+    attachments = [LoggedAttachment(id=a.id, name=a.filename, isImage=(a.width is not None or a.width == 0),
+                                    message_id=message.id) for a in message.attachments]
+    if message.id in PENDING or message.id in FLUSHING:
+        return PENDING.get(message.id, FLUSHING.get(message.id))[0]
+    if FLUSH_LOCK is None:
+        # no writer running (yet), write it right away
+        await write_batch({message.id: (logged, attachments)})
+        return logged
+    if len(PENDING) >= Configuration.get_master_var("MESSAGE_BATCH_MAX_PENDING", 10000):
+        # the database isn't keeping up, make the caller wait for a flush instead of growing without bounds
+        STATS["overflows"] += 1
+        await flush()
+    PENDING[message.id] = (logged, attachments)
+    STATS["queued"] += 1
+    if len(PENDING) >= Configuration.get_master_var("MESSAGE_BATCH_SIZE", 500):
+        FLUSH_EVENT.set()
+    return logged
+
+
+def get_pending(message_id):
+    pending = PENDING.get(message_id)
+    if pending is None:
+        pending = FLUSHING.get(message_id)
+    return pending
+
+
+def get_pending_edit(message_id):
+    edit = PENDING_EDITS.get(message_id)
+    if edit is None:
+        edit = FLUSHING_EDITS.get(message_id)
+    return edit
+
+
+async def update_message(message_id, content, pinned):
+    content = content.replace('\x00', '')
+    STATS["edits"] += 1
+    pending = PENDING.get(message_id)
+    if pending is not None:
+        # not written yet, the insert will carry the new values
+        pending[0].content = content
+        pending[0].pinned = pinned
+        STATS["edits_folded"] += 1
+        return
+    if FLUSH_LOCK is None:
+        await write_edits([(message_id, (content, pinned))])
+        return
+    if message_id in PENDING_EDITS:
+        STATS["edits_coalesced"] += 1
+        del PENDING_EDITS[message_id]
+    PENDING_EDITS[message_id] = (content, pinned)
+
 
-        if message_type == MessageType.default:
-            message_type = None
+async def flusher():
+    while not STOPPING:
+        interval = Configuration.get_master_var("MESSAGE_BATCH_INTERVAL", 500) / 1000
+        attempts = max(ATTEMPTS.values())
+        if attempts > 0:
+            # the database is having trouble, give it more room with every failed attempt
+            await asyncio.sleep(interval * 2 ** attempts)
         else:
-            if not isinstance(message_type, int):
-                message_type = message_type.value
-        is_reply = message.reference is not None and message.reference.channel_id == message.channel.id
-        logged = await LoggedMessage.create(messageid=message.id, content=message.content.replace('\x00', ''),
-                                    author=message.author.id,
-                                    channel=message.channel.id, server=message.guild.id,
-                                    type=message_type, pinned=message.pinned,
-                                            reply_to=message.reference.message_id if is_reply else None)
-        for a in message.attachments:
-            await LoggedAttachment.create(id=a.id, name=a.filename,
-                                       isImage=(a.width is not None or a.width == 0),
-                                       message=logged)
+            try:
+                await asyncio.wait_for(FLUSH_EVENT.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        FLUSH_EVENT.clear()
+        await flush()
+
+
+async def flush():
+    async with FLUSH_LOCK:
+        size = Configuration.get_master_var("MESSAGE_BATCH_SIZE", 500)
+        while len(PENDING) > 0:
+            while len(PENDING) > 0 and len(FLUSHING) < size:
+                message_id, pending = PENDING.popitem(last=False)
+                FLUSHING[message_id] = pending
+            try:
+                await write_batch(FLUSHING)
+            except asyncio.CancelledError:
+                # back in line so the next flush still writes them, rows that did make it in get skipped then
+                requeue(FLUSHING)
+                raise
+            except Exception as ex:
+                if retry("messages", FLUSHING, "Failed to write logged messages", ex):
+                    requeue(FLUSHING)
+                    # edits to these would update nothing yet, they wait for the next attempt as well
+                    return
+            else:
+                ATTEMPTS["messages"] = 0
+            finally:
+                FLUSHING.clear()
+        # edits go last so the rows they touch have been inserted
+        while len(PENDING_EDITS) > 0:
+            while len(PENDING_EDITS) > 0 and len(FLUSHING_EDITS) < size:
+                message_id, edit = PENDING_EDITS.popitem(last=False)
+                FLUSHING_EDITS[message_id] = edit
+            try:
+                await write_edits(list(FLUSHING_EDITS.items()))
+            except asyncio.CancelledError:
+                requeue_edits(FLUSHING_EDITS)
+                raise
+            except Exception as ex:
+                if retry("edits", FLUSHING_EDITS, "Failed to write message edits", ex):
+                    requeue_edits(FLUSHING_EDITS)
+                    return
+            else:
+                ATTEMPTS["edits"] = 0
+            finally:
+                FLUSHING_EDITS.clear()
+
+
+def retry(kind, batch, message, ex):
+    # True if the batch should go back in line for another attempt, False if it's out of retries and gets dropped
+    ATTEMPTS[kind] += 1
+    retries = Configuration.get_master_var("MESSAGE_BATCH_RETRIES", 5)
+    if ATTEMPTS[kind] < retries:
+        GearbotLogging.warn(f"{message} (attempt {ATTEMPTS[kind]} of {retries}), trying again later: {ex}")
+        return True
+    ATTEMPTS[kind] = 0
+    STATS["failed"] += len(batch)
+    GearbotLogging.exception(f"{message}, giving up on {len(batch)} after {retries} attempts", ex)
+    return False
+
+
+def requeue(batch):
+    for message_id, pending in reversed(list(batch.items())):
+        PENDING[message_id] = pending
+        PENDING.move_to_end(message_id, last=False)
+
+
+def requeue_edits(edits):
+    for message_id, edit in reversed(list(edits.items())):
+        # a newer edit that came in during the write wins
+        if message_id not in PENDING_EDITS:
+            PENDING_EDITS[message_id] = edit
+            PENDING_EDITS.move_to_end(message_id, last=False)
+
+
+async def write_batch(batch):
+    messages = [logged for logged, attachments in batch.values()]
+    attachments = [a for logged, message_attachments in batch.values() for a in message_attachments]
+    STATS["batches"] += 1
+    try:
+        await LoggedMessage.bulk_create(messages)
     except IntegrityError:
-        return message
-    return logged
+        # some were already logged (cache rebuilds, reconnects), go one by one so the rest still gets in
+        STATS["fallbacks"] += 1
+        for logged in messages:
+            try:
+                await logged.save(force_create=True)
+            except IntegrityError:
+                pass
+    if len(attachments) > 0:
+        try:
+            await LoggedAttachment.bulk_create(attachments)
+        except IntegrityError:
+            STATS["fallbacks"] += 1
+            for a in attachments:
+                try:
+                    await a.save(force_create=True)
+                except IntegrityError:
+                    pass
+    STATS["written"] += len(messages)
+
+
+async def write_edits(edits):
+    STATS["edit_batches"] += 1
+    # one statement executed for every edit, the database is mysql so %s placeholders
+    await LoggedMessage._meta.db.execute_many(
+        f"UPDATE {LoggedMessage._meta.db_table} SET content=%s, pinned=%s WHERE messageid=%s",
+        [[content, pinned, message_id] for message_id, (content, pinned) in edits])
+    STATS["edits_written"] += len(edits)
+
+
+def describe():
+    return f"Pending: {len(PENDING)}\nFlushing: {len(FLUSHING)}\nQueued: {STATS['queued']}\n" \
+           f"Written: {STATS['written']} in {STATS['batches']} batches\nOverflows: {STATS['overflows']}\n" \
+           f"Row by row fallbacks: {STATS['fallbacks']}\nFailed: {STATS['failed']}\n" \
+           f"Failed attempts on the current batch: {ATTEMPTS['messages']} messages, {ATTEMPTS['edits']} edits\n" \
+           f"Pending edits: {len(PENDING_EDITS)}\nFlushing edits: {len(FLUSHING_EDITS)}\nEdits: {STATS['edits']}\n" \
+           f"Written: {STATS['edits_written']} in {STATS['edit_batches']} batches\n" \
+           f"Saved: {STATS['edits_coalesced']} coalesced, {STATS['edits_folded']} folded into inserts"
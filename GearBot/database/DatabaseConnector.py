@@ -74,6 +74,20 @@ class RaidAction(Model):
     action = fields.CharField(max_length=20)
     infraction = fields.ForeignKeyField("models.Infraction", related_name="RaiderAction", source_field="infraction_id", null=True)
 
+class GuildConfig(Model):
+    guild_id = fields.BigIntField(pk=True, generated=False)
+    version = fields.IntField()
+    config = fields.TextField()
+
+class GuildConfigBackup(Model):
+    id = fields.IntField(pk=True, generated=True)
+    guild_id = fields.BigIntField()
+    version = fields.IntField()
+    config = fields.TextField()
+
+    class Meta:
+        unique_together = ("guild_id", "version")
+
 async def init():
     await Tortoise.init(
         config={
@@ -0,0 +1,124 @@
+"""
+Upgrades every guild config to the current template version ahead of time, so the bot doesn't have to do it
+guild by guild while starting up after an update. Works on whichever CONFIG_STORAGE the master config uses.
+
+Run from the repository root, with the bot stopped: python GearBot/migrate_configs.py [--dry-run] [--workers N]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from Util import Configuration, Utils
+from database import DatabaseConnector
+
+
+def upgrade(config, target):
+    if len(config) == 0:
+        return "unreadable", None
+    if "VERSION" not in config and len(config) < 15:
+        # the bot resets these on load, nothing to migrate
+        return "too old", None
+    version = config.get("VERSION", 0)
+    if version >= target:
+        return "up to date", None
+    return "migrated", Configuration.migrate(dict(copy.deepcopy(config), VERSION=version), target)
+
+
+def migrate_file(job):
+    guild_id, target, dry_run = job
+    try:
+        config = Utils.fetch_from_disk(f"config/{guild_id}")
+        status, migrated = upgrade(config, target)
+        if migrated is not None and not dry_run:
+            # one backup and one write per guild
+            backups = f"config/backups/v{config.get('VERSION', 0)}"
+            os.makedirs(backups, exist_ok=True)
+            Utils.save_to_disk(f"{backups}/{guild_id}", config)
+            Utils.save_to_disk(f"config/{guild_id}", migrated)
+        return guild_id, status, None
+    except Exception:
+        return guild_id, "failed", traceback.format_exc()
+
+
+def migrate_config(job):
+    # the database is only touched from the main process, this only gets the config and hands back what to write
+    guild_id, config, target = job
+    try:
+        status, migrated = upgrade(config, target)
+        data = None if migrated is None else json.dumps(migrated, skipkeys=True, separators=(',', ':'))
+        return guild_id, status, None, data
+    except Exception:
+        return guild_id, "failed", traceback.format_exc(), None
+
+
+def migrate_files(executor, target, dry_run, results, failures):
+    guild_ids = [int(name[:-5]) for name in os.listdir("config") if name.endswith(".json") and name[:-5].isdigit()]
+    jobs = [(guild_id, target, dry_run) for guild_id in guild_ids]
+    for guild_id, status, error in executor.map(migrate_file, jobs, chunksize=64):
+        results[status] += 1
+        if error is not None:
+            failures.append((guild_id, error))
+    return len(guild_ids)
+
+
+async def migrate_storage(executor, target, dry_run, results, failures):
+    await DatabaseConnector.init()
+    try:
+        storage = Configuration.get_storage()
+        guild_ids = await DatabaseConnector.GuildConfig.filter(version__lt=target).values_list("guild_id", flat=True)
+        for i in range(0, len(guild_ids), 1000):
+            configs = await storage.read_many(guild_ids[i:i + 1000])
+            jobs = [(guild_id, config, target) for guild_id, config in configs.items()]
+            rows = []
+            for guild_id, status, error, data in executor.map(migrate_config, jobs, chunksize=64):
+                results[status] += 1
+                if error is not None:
+                    failures.append((guild_id, error))
+                if data is not None and not dry_run:
+                    storage.backup(guild_id, configs[guild_id].get("VERSION", 0), configs[guild_id])
+                    rows.append((guild_id, target, data))
+            if len(rows) > 0:
+                # the backups queued above go in with these
+                await storage.write_many(rows)
+        return len(guild_ids)
+    finally:
+        await DatabaseConnector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate all guild configs to the current version")
+    parser.add_argument("--dry-run", action="store_true", help="run the migrations but don't write anything")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
+    target = Utils.fetch_from_disk("GearBot/template")["VERSION"]
+    storage = Configuration.get_master_var("CONFIG_STORAGE", "file")
+    if storage not in Configuration.STORAGE_TYPES:
+        parser.error(f"Unknown CONFIG_STORAGE in the master config: {storage}")
+    print(f"Migrating {storage} configs to version {target} with {args.workers} workers{' (dry run)' if args.dry_run else ''}")
+
+    start = time.perf_counter()
+    results = Counter()
+    failures = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if storage == "file":
+            total = migrate_files(executor, target, args.dry_run, results, failures)
+        else:
+            total = asyncio.run(migrate_storage(executor, target, args.dry_run, results, failures))
+    duration = time.perf_counter() - start
+
+    for status, count in sorted(results.items()):
+        print(f"{status:>12}: {count}")
+    print(f"Done in {duration:.2f}s ({duration / max(total, 1) * 1000:.2f} ms per config)")
+    for guild_id, error in failures:
+        print(f"\nFailed to migrate {guild_id}:\n{error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares the censor token matcher against checking every entry with fnmatch, the way the censor used to do it.
+
+Run from the repository root: python benchmarks/token_matcher.py
+"""
+import fnmatch
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GearBot"))
+
+from Util.TokenMatcher import TokenMatcher
+
+random.seed(1337)
+
+
+def random_word(low=4, high=10):
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(low, high)))
+
+
+def random_token():
+    word = random_word()
+    roll = random.random()
+    # mostly plain tokens with a sprinkle of the wildcards people actually use
+    if roll < 0.1:
+        return f"{word[:2]}*{word[2:]}"
+    if roll < 0.15:
+        return f"{word[:3]}?{word[4:]}"
+    if roll < 0.2:
+        return f"[{word[0]}{word[1]}]{word[2:]}"
+    return word
+
+
+def fnmatch_loop(tokens, content):
+    for bad in tokens:
+        if fnmatch.fnmatchcase(content, f'*{bad.lower()}*'):
+            return bad
+    return None
+
+
+def main():
+    messages = [" ".join(random_word(2, 8) for _ in range(random.randint(3, 40))) for _ in range(200)]
+    print(f"{'tokens':>8} {'fnmatch loop':>16} {'token matcher':>16} {'build':>10}")
+    for size in (10, 1_000, 50_000):
+        tokens = [random_token() for _ in range(size)]
+        start = timeit.default_timer()
+        matcher = TokenMatcher(tokens)
+        build = timeit.default_timer() - start
+        for message in messages:
+            assert matcher.find(message) == fnmatch_loop(tokens, message)
+        # the loop gets slow enough at 50k tokens that a handful of messages says enough
+        sample = messages if size <= 1_000 else messages[:10]
+        loop = timeit.timeit(lambda: [fnmatch_loop(tokens, m) for m in sample], number=1) / len(sample)
+        fast = timeit.timeit(lambda: [matcher.find(m) for m in messages], number=5) / (len(messages) * 5)
+        print(f"{size:>8} {loop * 1_000_000:>13.1f} us {fast * 1_000_000:>13.1f} us {build * 1000:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares formatting every string in lang/en_US.json with pyseeyou.format (parsing on every call, the way the
+translator used to do it) against the templates the translator now parses once when loading.
+
+Run from the repository root: python benchmarks/translations.py
+"""
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GearBot"))
+
+from pyseeyou import format
+
+from Util import Translator
+
+ARGUMENT = re.compile(r"{\s*(\w+)")
+
+
+def build_arguments(strings):
+    # every key with a set of arguments it formats cleanly with, numbers for plurals and strings for the rest
+    cases = []
+    for key, message in strings.items():
+        names = set(ARGUMENT.findall(message))
+        for value in (2, "value"):
+            kwargs = {name: value for name in names}
+            try:
+                format(message, kwargs, "en_US")
+            except Exception:
+                continue
+            cases.append((key, kwargs))
+            break
+    return cases
+
+
+def main():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lang", "en_US.json"), encoding="utf-8") as file:
+        strings = json.load(file)
+    start = timeit.default_timer()
+    Translator.LANGS["en_US"] = strings
+    Translator.TEMPLATES["en_US"] = Translator.compile_templates(strings)
+    compile_time = timeit.default_timer() - start
+
+    cases = build_arguments(strings)
+    plain = sum(1 for key, kwargs in cases if isinstance(Translator.TEMPLATES["en_US"][key], str))
+    for key, kwargs in cases:
+        assert Translator.format_template("en_US", key, kwargs) == format(strings[key], kwargs, "en_US"), key
+
+    parse_every_time = timeit.timeit(lambda: [format(strings[key], kwargs, "en_US") for key, kwargs in cases], number=5) / (len(cases) * 5)
+    parsed_once = timeit.timeit(lambda: [Translator.format_template("en_US", key, kwargs) for key, kwargs in cases], number=5) / (len(cases) * 5)
+    print(f"{len(cases)} strings ({plain} without placeholders), templates compiled in {compile_time * 1000:.1f} ms")
+    print(f"{'parse every call':>18} {parse_every_time * 1_000_000:>8.1f} us per string")
+    print(f"{'parsed once':>18} {parsed_once * 1_000_000:>8.1f} us per string")
+    print(f"{'speedup':>18} {parse_every_time / parsed_once:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import copy
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "GearBot"))
+
+from Util import Configuration, ConfigListeners, ConfigViews
+
+with open(os.path.join(ROOT, "GearBot", "template.json")) as handle:
+    TEMPLATE = json.load(handle)
+
+
+class ConfiguredTest(unittest.TestCase):
+
+    def setUp(self):
+        ConfigViews.build_types(TEMPLATE)
+        self.addCleanup(self.drop_types)
+        self.addCleanup(Configuration.SERVER_CONFIGS.clear)
+
+    @staticmethod
+    def drop_types():
+        ConfigViews.SECTION_TYPES.clear()
+        ConfigViews.GUILD_CONFIG_TYPE = None
+
+    def set_config(self, guild_id, config):
+        Configuration.SERVER_CONFIGS[guild_id] = ConfigViews.compact(copy.deepcopy(config))
+        ConfigListeners.notify(guild_id)
+
+
+class ConfigViewsTest(ConfiguredTest):
+
+    def test_round_trip(self):
+        config = copy.deepcopy(TEMPLATE)
+        config["PERMISSIONS"]["NOT_IN_THE_TEMPLATE"] = [1, 2]
+        config["SOMETHING_NEW"] = {"A": 1}
+        compact = ConfigViews.compact(copy.deepcopy(config))
+        self.assertIsInstance(compact["PERMISSIONS"], ConfigViews.Section)
+        self.assertEqual(ConfigViews.to_dict(compact), config)
+        self.assertEqual(json.loads(json.dumps(ConfigViews.to_dict(compact))), config)
+
+    def test_reads_like_a_dict(self):
+        config = copy.deepcopy(TEMPLATE)
+        compact = ConfigViews.compact(copy.deepcopy(config))
+        for name, section in config.items():
+            self.assertIn(name, compact)
+            if not isinstance(section, dict):
+                self.assertEqual(compact[name], section)
+                continue
+            view = compact[name]
+            self.assertEqual(len(view), len(section))
+            self.assertEqual(set(view.keys()), set(section.keys()))
+            self.assertEqual(dict(view.items()), section)
+            for key, value in section.items():
+                self.assertEqual(view.get(key), value)
+            self.assertIsNone(view.get("MISSING"))
+            self.assertNotIn("MISSING", view)
+        self.assertRaises(KeyError, lambda: compact["PERMISSIONS"]["MISSING"])
+
+    def test_changes_show_up(self):
+        self.set_config(1, TEMPLATE)
+        Configuration.SERVER_CONFIGS[1].get("PERMISSIONS")["MOD_ROLES"] = [5]
+        self.assertEqual(ConfigViews.to_dict(Configuration.SERVER_CONFIGS[1])["PERMISSIONS"]["MOD_ROLES"], [5])
+        self.assertEqual(ConfigViews.get(1).permission_roles["MOD"], frozenset([5]))
+        # saving rebuilds the view
+        Configuration.SERVER_CONFIGS[1].get("PERMISSIONS")["MOD_ROLES"] = [5, 6]
+        ConfigListeners.notify(1)
+        self.assertEqual(ConfigViews.get(1).permission_roles["MOD"], frozenset([5, 6]))
+        Configuration.SERVER_CONFIGS[1].get("PERMISSIONS")["MOD_ROLES"] = []
+        ConfigListeners.notify(1)
+        self.assertEqual(ConfigViews.get(1).permission_roles["MOD"], frozenset())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import random
+import re
+import string
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GearBot"))
+
+from Util import Configuration, ConfigListeners, MatcherRegistry
+
+
+def random_word(rng, low=1, high=6, letters="abc"):
+    # small alphabets so the lists and messages actually overlap
+    return "".join(rng.choice(letters) for _ in range(rng.randint(low, high)))
+
+
+# the way the censor and flagging used to build their word regex
+def old_word_matcher(words):
+    return re.compile(r"(?:\b| )(" + '|'.join(re.escape(word) for word in words) + r")(?:\b| )", re.IGNORECASE | re.MULTILINE)
+
+
+class WordMatcherTest(unittest.TestCase):
+
+    def test_against_alternation(self):
+        rng = random.Random(1337)
+        letters = "ab" + string.punctuation[:3] + " "
+        for _ in range(300):
+            words = list({random_word(rng, 1, 4, letters).strip() or "a" for _ in range(rng.randint(1, 20))})
+            old = old_word_matcher(words)
+            new = MatcherRegistry.build_word_matcher(words)
+            for _ in range(20):
+                content = random_word(rng, 0, 20, letters + "AB")
+                with self.subTest(words=words, content=content):
+                    # the trie can pick a longer word than the alternation where both would fit, whether it hits can't change
+                    self.assertEqual(len(new.findall(content)) > 0, len(old.findall(content)) > 0)
+
+    def test_words_match_the_same(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            words = [random_word(rng, 1, 5) for _ in range(rng.randint(1, 20))]
+            old = old_word_matcher(words)
+            new = MatcherRegistry.build_word_matcher(words)
+            for _ in range(20):
+                content = " ".join(random_word(rng, 1, 5, "abcABC") for _ in range(rng.randint(0, 6)))
+                with self.subTest(words=words, content=content):
+                    self.assertEqual([m.lower() for m in new.findall(content)], [m.lower() for m in old.findall(content)])
+
+    def test_long_words(self):
+        # used to recurse a level per character
+        word = "a" * 5000
+        self.assertEqual(MatcherRegistry.build_word_matcher([word, "b"]).findall(f"x {word} b"), [word, "b"])
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lists = dict()
+        MatcherRegistry.MATCHERS.clear()
+        MatcherRegistry.DIGESTS.clear()
+        patches = [
+            mock.patch.object(Configuration, "get_var", lambda guild, section, key: self.lists[(guild, section, key)]),
+            mock.patch.object(Configuration, "get_master_var", lambda key, default=None: 2 if key == "MATCHER_CACHE_SIZE" else default)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_cached_until_changed(self):
+        self.lists[(1, "CENSORING", "TOKEN_CENSORLIST")] = ["bad"]
+        matcher = MatcherRegistry.get_token_matcher(1, "CENSORING", "TOKEN_CENSORLIST")
+        self.assertIs(MatcherRegistry.get_token_matcher(1, "CENSORING", "TOKEN_CENSORLIST"), matcher)
+        self.lists[(1, "CENSORING", "TOKEN_CENSORLIST")] = ["worse"]
+        ConfigListeners.notify(1)
+        matcher = MatcherRegistry.get_token_matcher(1, "CENSORING", "TOKEN_CENSORLIST")
+        self.assertEqual(matcher.find("this is worse"), "worse")
+        self.assertEqual(matcher.find("this is bad"), None)
+
+    def test_eviction(self):
+        for guild in range(5):
+            self.lists[(guild, "FLAGGING", "WORD_LIST")] = [f"word{guild}"]
+            MatcherRegistry.get_word_matcher(guild, "FLAGGING", "WORD_LIST")
+        self.assertEqual(len(MatcherRegistry.MATCHERS), 2)
+        # digests go together with their matchers
+        self.assertEqual(set(MatcherRegistry.DIGESTS.keys()), {(3, "FLAGGING", "WORD_LIST"), (4, "FLAGGING", "WORD_LIST")})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import copy
+import json
+import os
+import random
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "GearBot"))
+
+from Util import Configuration, ConfigListeners, ConfigViews, Permissioncheckers
+
+with open(os.path.join(ROOT, "GearBot", "template.json")) as handle:
+    TEMPLATE = json.load(handle)
+
+PERMISSION_TYPES = ("LVL4", "ADMIN", "MOD", "TRUSTED")
+
+
+class Basic:
+    permissions = {"min": 0, "max": 6, "required": 0, "commands": {}}
+
+
+class Moderation:
+    permissions = {
+        "min": 2, "max": 6, "required": 2,
+        "commands": {
+            "ban": {"required": 3, "min": 2, "max": 6, "commands": {}},
+            "role|roles": {"required": -1, "min": 2, "max": 6, "commands": {
+                "add": {"required": 3, "min": 2, "max": 6, "commands": {}}
+            }}
+        }
+    }
+
+
+class FakeCommand:
+
+    def __init__(self, qualified_name, cog):
+        self.qualified_name = qualified_name
+        self.cog = cog
+
+
+COMMANDS = [FakeCommand("about", Basic()), FakeCommand("ban", Moderation()), FakeCommand("role", Moderation()),
+            FakeCommand("role add", Moderation()), FakeCommand("roles add", Moderation()), FakeCommand("kick", Moderation())]
+
+
+# how the levels used to be worked out, straight from the config on every check
+def baseline_is_user(config, perm_type, member):
+    if member.id in config["PERMISSIONS"][f"{perm_type}_USERS"]:
+        return True
+    return any(role.id in config["PERMISSIONS"][f"{perm_type}_ROLES"] for role in member.roles)
+
+
+def baseline_user_lvl(config, guild, member, command_object=None):
+    if guild.owner is not None and guild.owner.id == member.id:
+        return 5
+    if baseline_is_user(config, "LVL4", member):
+        return 4
+    if command_object is not None:
+        cog_name = type(command_object.cog).__name__
+        overrides = config["PERM_OVERRIDES"]
+        if cog_name in overrides:
+            target = overrides[cog_name]
+            pieces = Permissioncheckers.get_command_pieces(command_object)
+            while len(pieces) > 0 and "commands" in target and pieces[0] in target["commands"]:
+                target = target["commands"][pieces.pop(0)]
+                if member.id in target["people"]:
+                    return 4
+    if baseline_is_user(config, "ADMIN", member) or member.guild_permissions.administrator:
+        return 3
+    if baseline_is_user(config, "MOD", member) or member.guild_permissions.ban_members:
+        return 2
+    if baseline_is_user(config, "TRUSTED", member):
+        return 1
+    return 0
+
+
+def baseline_check_permission(config, command_object, guild, member):
+    overrides = config["PERM_OVERRIDES"]
+    cog_name = type(command_object.cog).__name__
+    required = -1
+    if cog_name in overrides:
+        required = Permissioncheckers.get_required(command_object, overrides[cog_name])
+    if required == -1:
+        required = Permissioncheckers.get_required(command_object, command_object.cog.permissions)
+    return baseline_user_lvl(config, guild, member, command_object) >= (command_object.cog.permissions["required"] if required == -1 else required)
+
+
+def random_override(rng, people):
+    return {"required": rng.choice([-1, -1, 0, 1, 2, 3, 4]), "people": rng.sample(people, rng.randint(0, 2)), "commands": {}}
+
+
+def random_config(rng, roles, people):
+    config = copy.deepcopy(TEMPLATE)
+    for perm_type in PERMISSION_TYPES:
+        config["PERMISSIONS"][f"{perm_type}_ROLES"] = rng.sample(roles, rng.randint(0, 2))
+        config["PERMISSIONS"][f"{perm_type}_USERS"] = rng.sample(people, rng.randint(0, 1))
+    if rng.random() < 0.7:
+        moderation = random_override(rng, people)
+        moderation["commands"]["ban"] = random_override(rng, people)
+        role = moderation["commands"]["role"] = random_override(rng, people)
+        role["commands"]["add"] = random_override(rng, people)
+        config["PERM_OVERRIDES"]["Moderation"] = moderation
+    return config
+
+
+def make_member(member_id, guild, roles, administrator=False, ban_members=False):
+    return SimpleNamespace(id=member_id, guild=guild, roles=[SimpleNamespace(id=role) for role in roles], _roles=list(roles),
+                           guild_permissions=SimpleNamespace(administrator=administrator, ban_members=ban_members))
+
+
+def random_member(rng, member_id, guild, roles):
+    return make_member(member_id, guild, rng.sample(roles, rng.randint(0, 3)), rng.random() < 0.1, rng.random() < 0.15)
+
+
+class ConfiguredTest(unittest.TestCase):
+
+    def setUp(self):
+        ConfigViews.build_types(TEMPLATE)
+        self.addCleanup(self.drop_types)
+        self.addCleanup(Configuration.SERVER_CONFIGS.clear)
+        master = {"PERMISSION_CACHE_TTL": 30, "PERMISSION_CACHE_SIZE": 50000}
+        patch = mock.patch.object(Configuration, "get_master_var", lambda key, default=None: master.get(key, default))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @staticmethod
+    def drop_types():
+        ConfigViews.SECTION_TYPES.clear()
+        ConfigViews.GUILD_CONFIG_TYPE = None
+
+    def set_config(self, guild_id, config):
+        Configuration.SERVER_CONFIGS[guild_id] = ConfigViews.compact(copy.deepcopy(config))
+        ConfigListeners.notify(guild_id)
+
+
+class PermissionLevelTest(ConfiguredTest):
+
+    def setUp(self):
+        super().setUp()
+        Permissioncheckers.cogs_changed()
+
+    def test_against_baseline(self):
+        rng = random.Random(99)
+        roles = list(range(100, 106))
+        people = list(range(1, 8))
+        for guild_id in range(1000, 1200):
+            config = random_config(rng, roles, people)
+            self.set_config(guild_id, config)
+            guild = SimpleNamespace(id=guild_id, owner=SimpleNamespace(id=rng.choice(people + [0])))
+            for member_id in people:
+                member = random_member(rng, member_id, guild, roles)
+                with self.subTest(config=config, member=member):
+                    self.assertEqual(Permissioncheckers.get_user_lvl(guild, member), baseline_user_lvl(config, guild, member))
+                    for command in COMMANDS:
+                        self.assertEqual(Permissioncheckers.get_user_lvl(guild, member, command), baseline_user_lvl(config, guild, member, command))
+                        self.assertEqual(Permissioncheckers.check_permission(command, guild, member, None), baseline_check_permission(config, command, guild, member))
+
+    def test_config_changes(self):
+        guild = SimpleNamespace(id=1, owner=None)
+        member = make_member(5, guild, [])
+        config = copy.deepcopy(TEMPLATE)
+        self.set_config(1, config)
+        self.assertEqual(Permissioncheckers.get_user_lvl(guild, member), 0)
+        config["PERMISSIONS"]["ADMIN_USERS"] = [5]
+        self.set_config(1, config)
+        self.assertEqual(Permissioncheckers.get_user_lvl(guild, member), 3)
+
+    def test_role_changes(self):
+        guild = SimpleNamespace(id=1, owner=None)
+        config = copy.deepcopy(TEMPLATE)
+        config["PERMISSIONS"]["MOD_ROLES"] = [100]
+        self.set_config(1, config)
+        before = make_member(5, guild, [])
+        self.assertEqual(Permissioncheckers.get_user_lvl(guild, before), 0)
+        after = make_member(5, guild, [100])
+        Permissioncheckers.member_updated(before, after)
+        self.assertEqual(Permissioncheckers.get_user_lvl(guild, after), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import importlib.util
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GearBot"))
+
+from aioredis import ReplyError
+
+from Util import SpamBucket
+from Util.SpamBucket import MemoryBucketStore, RedisBucketStore, BucketResult
+
+try:
+    # fakeredis runs the real lua script through lupa, no redis server needed: pip install -r requirements-test.txt
+    import fakeredis
+    from redis.exceptions import NoScriptError
+except ImportError:
+    fakeredis = None
+LUA = importlib.util.find_spec("lupa") is not None
+
+
+class FakeRedis:
+    """The parts of the aioredis 1.3 api RedisBucketStore uses, on top of fakeredis"""
+
+    def __init__(self):
+        self.redis = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    async def evalsha(self, sha, keys, args):
+        try:
+            return self.redis.evalsha(sha, len(keys), *keys, *args)
+        except NoScriptError:
+            raise ReplyError("NOSCRIPT No matching script. Please use EVAL.")
+
+    async def script_load(self, script):
+        return self.redis.script_load(script)
+
+    async def unlink(self, key):
+        return self.redis.unlink(key)
+
+
+@unittest.skipIf(fakeredis is None or not LUA, "needs fakeredis and lupa to run the lua script, see requirements-test.txt")
+class StoreParityTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = RedisBucketStore(FakeRedis())
+        self.memory = MemoryBucketStore()
+
+    async def hit(self, *args):
+        expected = await self.redis.hit(*args)
+        self.assertEqual(await self.memory.hit(*args), expected, args)
+        return expected
+
+    async def test_single_message(self):
+        self.assertEqual(await self.hit("bucket", 100, 10, "1-1", 1, True, 2), BucketResult(False, 1, 0, set()))
+        self.assertEqual(await self.hit("bucket", 105, 10, "1-2", 1, True, 2), BucketResult(True, 2, 5, {"1-1-0", "1-2-0"}))
+
+    async def test_expiry(self):
+        await self.hit("bucket", 100, 10, "1-1", 3, True, 5)
+        # exactly one period later counts as expired
+        self.assertEqual(await self.hit("bucket", 110, 10, "1-2", 1, True, 5), BucketResult(False, 1, 0, set()))
+        # without expiring the old ones stay around
+        await self.hit("bucket", 200, 10, "1-3", 1, False, 5)
+        self.assertEqual((await self.hit("bucket", 200, 10, "1-4", 0, False, 1)).count, 2)
+
+    async def test_clear(self):
+        await self.hit("bucket", 100, 10, "1-1", 4, True, 2)
+        await self.redis.clear("bucket")
+        await self.memory.clear("bucket")
+        self.assertEqual(await self.hit("bucket", 101, 10, "1-2", 1, True, 2), BucketResult(False, 1, 0, set()))
+
+    async def test_random(self):
+        rng = random.Random(1234)
+        keys = ["a", "b", "c"]
+        times = {key: 1000 for key in keys}
+        for i in range(500):
+            key = rng.choice(keys)
+            if rng.random() < 0.02:
+                await self.redis.clear(key)
+                await self.memory.clear(key)
+                continue
+            times[key] += rng.choice([0, 0, 1, 2, 5, 30])
+            await self.hit(key, times[key], 20, f"message-{i}", rng.choice([0, 1, 1, 1, 2, 3]), rng.random() < 0.9,
+                           rng.randint(1, 15))
+
+
+class MemoryStoreTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reset_bucket_is_recent(self):
+        store = MemoryBucketStore(max_keys=2)
+        with mock.patch.object(SpamBucket.time, "time", return_value=100):
+            await store.hit("a", 100, 10, "1-1", 1, True, 5)
+            await store.hit("b", 100, 10, "1-2", 1, True, 5)
+        # a has expired and gets a fresh bucket, that makes b the oldest one to make room for c
+        with mock.patch.object(SpamBucket.time, "time", return_value=105):
+            await store.hit("b", 105, 10, "1-3", 1, True, 5)
+        with mock.patch.object(SpamBucket.time, "time", return_value=112):
+            await store.hit("a", 112, 10, "1-4", 1, True, 5)
+            await store.hit("c", 112, 10, "1-5", 1, True, 5)
+        self.assertEqual(list(store.buckets.keys()), ["a", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import fnmatch
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "GearBot"))
+
+from Util.TokenMatcher import TokenMatcher
+
+
+def random_word(rng, low=1, high=6, letters="abc"):
+    # small alphabets so the lists and messages actually overlap
+    return "".join(rng.choice(letters) for _ in range(rng.randint(low, high)))
+
+
+def random_pattern(rng):
+    word = random_word(rng, 2, 6)
+    roll = rng.random()
+    if roll < 0.15:
+        return f"{word[:1]}*{word[1:]}"
+    if roll < 0.25:
+        return f"{word[:1]}?{word[2:]}"
+    if roll < 0.3:
+        return f"[{word[0]}c]{word[1:]}"
+    if roll < 0.33:
+        return f"[!a]{word}"
+    if roll < 0.35:
+        return f"[{word}"
+    if roll < 0.37:
+        return "*"
+    return word.upper() if roll < 0.4 else word
+
+
+# the way the censor and flagging used to check the lists, entry by entry
+def old_token_find(patterns, content):
+    for bad in patterns:
+        if fnmatch.fnmatchcase(content, f'*{bad.lower()}*'):
+            return bad
+    return None
+
+
+def old_full_message_find(patterns, content):
+    for bad in patterns:
+        if fnmatch.fnmatchcase(content, bad.lower()):
+            return bad
+    return None
+
+
+class TokenMatcherTest(unittest.TestCase):
+
+    def test_against_fnmatch(self):
+        rng = random.Random(42)
+        for _ in range(300):
+            patterns = [random_pattern(rng) for _ in range(rng.randint(0, 30))]
+            matcher = TokenMatcher(patterns)
+            full = TokenMatcher(patterns, True)
+            for _ in range(20):
+                content = " ".join(random_word(rng) for _ in range(rng.randint(0, 5)))
+                with self.subTest(patterns=patterns, content=content):
+                    self.assertEqual(matcher.find(content), old_token_find(patterns, content))
+                    self.assertEqual(full.find(content), old_full_message_find(patterns, content))
+
+    def test_first_in_list_wins(self):
+        matcher = TokenMatcher(["b*d", "bad", "a"])
+        self.assertEqual(matcher.find("this is bad"), "b*d")
+        self.assertEqual(matcher.find("nothing"), None)
+        self.assertEqual(TokenMatcher(["bad", "b*d"], True).find("bad"), "bad")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import re
+import sys
+import unittest
+from importlib.metadata import version
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "GearBot"))
+
+from parsimonious import ParseError, VisitationError
+from pyseeyou import format
+
+from Util import Translator
+
+ARGUMENT = re.compile(r"{\s*(\w+)")
+# numbers for the plurals (one, other and the exact =0 cases), a string for everything else
+VALUES = (0, 1, 2, "value")
+# what translate catches and reports as a corrupt translation
+CORRUPT = (KeyError, ValueError, ParseError, VisitationError)
+
+
+def load_langs():
+    langs = dict()
+    for file in sorted(os.listdir(os.path.join(ROOT, "lang"))):
+        if file.endswith(".json"):
+            with open(os.path.join(ROOT, "lang", file), encoding="utf-8") as handle:
+                langs[file[:-5]] = json.load(handle)
+    return langs
+
+
+class TemplateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.langs = load_langs()
+        for lang, strings in cls.langs.items():
+            Translator.LANGS[lang] = strings
+            Translator.TEMPLATES[lang] = Translator.compile_templates(strings)
+
+    def test_pinned_version(self):
+        # the templates are only used on this version, if this fails check the comparison below passes before bumping
+        self.assertEqual(version("pyseeyou"), Translator.TEMPLATE_PYSEEYOU)
+        with open(os.path.join(ROOT, "requirements.txt")) as handle:
+            self.assertIn(f"pyseeyou=={Translator.TEMPLATE_PYSEEYOU}\n", handle.read())
+
+    def test_matches_pyseeyou(self):
+        for lang, strings in self.langs.items():
+            for key, message in strings.items():
+                names = set(ARGUMENT.findall(message))
+                for value in VALUES:
+                    kwargs = {name: value for name in names}
+                    with self.subTest(lang=lang, key=key, value=value):
+                        try:
+                            expected = format(message, kwargs, lang)
+                        except CORRUPT:
+                            # broken strings or values they can't take, pyseeyou wraps some of these in a VisitationError
+                            with self.assertRaises(CORRUPT):
+                                Translator.format_template(lang, key, kwargs)
+                        else:
+                            self.assertEqual(Translator.format_template(lang, key, kwargs), expected)
+
+    def test_everything_compiled(self):
+        # only strings pyseeyou can't parse should be falling back to parsing on every call
+        for lang, strings in self.langs.items():
+            for key in strings.keys() - Translator.TEMPLATES[lang].keys():
+                with self.subTest(lang=lang, key=key):
+                    self.assertRaises(ParseError, Translator.ICUMessageFormat.parse, strings[key])
+
+
+if __name__ == '__main__':
+    unittest.main()